@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from typing import Optional
@@ -7,13 +8,18 @@ import anthropic
 import openai
 from google import genai
 import os
+import sys
 import time
 from tenacity import retry, stop_after_attempt, wait_exponential
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import Metrics, PROMETHEUS_CONTENT_TYPE
+
 # Initialize FastAPI app
 app = FastAPI(swagger_ui_parameters={"syntaxHighlight": False})
+metrics = Metrics("attendanceManager")
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,6 +37,8 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Optional Gemini endpoint override, e.g. the local stub used by benchmarkSuite.py.
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
 
 # Database connection with retry
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
@@ -76,12 +84,16 @@ def add_attendance(entry: AttendanceEntry):
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format")
     try:
-        cursor.execute("SELECT 1 FROM attendance WHERE employee_id = %s AND date = %s", (entry.employee_id, entry.date))
-        if cursor.fetchone():
+        with metrics.timer("add_attendance_query"):
+            cursor.execute("SELECT 1 FROM attendance WHERE employee_id = %s AND date = %s", (entry.employee_id, entry.date))
+            exists = cursor.fetchone()
+        if exists:
             raise HTTPException(status_code=400, detail="Record already exists")
-        cursor.execute("INSERT INTO attendance (employee_id, date, status, department) VALUES (%s, %s, %s, %s)", 
-                       (entry.employee_id, entry.date, entry.status, entry.department))
-        conn.commit()
+        with metrics.timer("add_attendance_query"):
+            cursor.execute("INSERT INTO attendance (employee_id, date, status, department) VALUES (%s, %s, %s, %s)", 
+                           (entry.employee_id, entry.date, entry.status, entry.department))
+        with metrics.timer("add_attendance_commit"):
+            conn.commit()
         return {"message": "Attendance added"}
     except psycopg2.Error as e:
         conn.rollback()
@@ -91,9 +103,11 @@ def add_attendance(entry: AttendanceEntry):
 @app.put("/attendance/")
 def update_attendance(entry: AttendanceEntry):
     try:
-        cursor.execute("UPDATE attendance SET status = %s, department = %s WHERE employee_id = %s AND date = %s",
-                       (entry.status, entry.department, entry.employee_id, entry.date))
-        conn.commit()
+        with metrics.timer("update_attendance_query"):
+            cursor.execute("UPDATE attendance SET status = %s, department = %s WHERE employee_id = %s AND date = %s",
+                           (entry.status, entry.department, entry.employee_id, entry.date))
+        with metrics.timer("update_attendance_commit"):
+            conn.commit()
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="No record found")
         return {"message": "Attendance updated"}
@@ -105,8 +119,9 @@ def update_attendance(entry: AttendanceEntry):
 @app.get("/attendance/trends")
 def get_attendance_trends():
     try:
-        cursor.execute("SELECT employee_id, department, status, COUNT(*) FROM attendance GROUP BY department, employee_id, status")
-        records = cursor.fetchall()
+        with metrics.timer("trends_query"):
+            cursor.execute("SELECT employee_id, department, status, COUNT(*) FROM attendance GROUP BY department, employee_id, status")
+            records = cursor.fetchall()
         trends = {}
         for emp_id, department, status, count in records:
             if emp_id not in trends:
@@ -120,8 +135,9 @@ def get_attendance_trends():
 @app.get("/attendance/{employee_id}")
 def get_attendance(employee_id: int):
     try:
-        cursor.execute("SELECT * FROM attendance WHERE employee_id = %s", (employee_id,))
-        rows = cursor.fetchall()
+        with metrics.timer("get_attendance_query"):
+            cursor.execute("SELECT * FROM attendance WHERE employee_id = %s", (employee_id,))
+            rows = cursor.fetchall()
         if not rows:
             return {"message": "No records found"}
         return {"attendance": rows}
@@ -133,17 +149,23 @@ def get_attendance(employee_id: int):
 @app.post("/insights/")
 def get_insights(request: InsightsRequest):
     try:
-        cursor.execute("SELECT employee_id, status, department FROM attendance")
-        records = cursor.fetchall()
+        with metrics.timer("insights_query"):
+            cursor.execute("SELECT employee_id, status, department FROM attendance")
+            records = cursor.fetchall()
         text_data = "\n".join([f"Employee {r[0]} from {r[2]} was {r[1]}" for r in records])
         user_query = request.user_query or "Provide insights on the attendance data."
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        response = client.models.generate_content(
-            model="gemini-2.0-flash", contents=f"Data:\n{text_data}\n\nQuestion: {user_query}"
-        )
+        client = genai.Client(api_key=GEMINI_API_KEY, http_options={"base_url": GEMINI_BASE_URL} if GEMINI_BASE_URL else None)
+        with metrics.timer("insights_llm"):
+            response = client.models.generate_content(
+                model="gemini-2.0-flash", contents=f"Data:\n{text_data}\n\nQuestion: {user_query}"
+            )
         return {"insights": response.text}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI error: {str(e)}")
 
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run(app, host='0.0.0.0', port=8000)
@@ -14,23 +14,35 @@ class AttendanceUser(HttpUser):
             "status": random.choice(["Present", "Absent", "WFH"]),
             "department": random.choice(["HR", "Engineering", "Sales"])
         }
-        self.client.post("/attendance/", json=data)
+        with self.client.post("/attendance/", json=data, catch_response=True) as response:
+            # Repeated (employee, date) pairs are expected to be rejected.
+            if response.status_code == 400 and "already exists" in response.text:
+                response.success()
+            elif response.status_code != 200 or "message" not in response.json():
+                response.failure(f"Unexpected response: {response.status_code} {response.text[:200]}")
 
     @task(1)
     def get_attendance(self):
         """Simulates fetching an employee's attendance records."""
         employee_id = random.randint(1, 100)
-        self.client.get(f"/attendance/{employee_id}")
+        with self.client.get(f"/attendance/{employee_id}", name="/attendance/[employee_id]", catch_response=True) as response:
+            # {"message": "No records found"} just means nothing was added for this employee yet.
+            if response.status_code != 200 or not ({"attendance", "message"} & response.json().keys()):
+                response.failure(f"Unexpected response: {response.status_code} {response.text[:200]}")
 
     @task(1)
     def get_attendance_trends(self):
         """Simulates fetching attendance trends."""
-        self.client.get("/attendance/trends")
+        with self.client.get("/attendance/trends", catch_response=True) as response:
+            if response.status_code != 200 or "attendance_trends" not in response.json():
+                response.failure(f"Unexpected response: {response.status_code} {response.text[:200]}")
 
     @task(1)
     def get_insights(self):
-        """Simulates making a request to the /insight endpoint."""
-        self.client.post("/insight", json={"user_query": "Show me attendance insights"})
+        """Simulates making a request to the /insights/ endpoint."""
+        with self.client.post("/insights/", json={"user_query": "Show me attendance insights"}, catch_response=True) as response:
+            if response.status_code != 200 or not response.json().get("insights"):
+                response.failure(f"Unexpected response: {response.status_code} {response.text[:200]}")
 
 
 
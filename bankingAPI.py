@@ -1,13 +1,18 @@
 import logging
+import os
+import time
 from typing import Dict, Any, Optional
 
 from fastapi import FastAPI, HTTPException, Depends
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, Field
 from sqlalchemy import create_engine, Column, Integer, Float, String, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
+from instrumentation import Metrics, PROMETHEUS_CONTENT_TYPE
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -15,7 +20,7 @@ DB_USER = "user"
 DB_PASSWORD = "password"
 DB_HOST = "localhost"
 DB_NAME = "banking"
-DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+DATABASE_URL = os.environ.get("DATABASE_URL", f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}")
 
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
@@ -50,6 +55,7 @@ app = FastAPI(
     description="A simple API for banking operations",
     version="1.0.0"
 )
+metrics = Metrics("banking")
 
 def get_db():
     db = SessionLocal()
@@ -62,7 +68,9 @@ def get_db():
 def debit(request: TransactionRequest, db: Session = Depends(get_db)):
     try:
         with db.begin():
-            account = db.query(Account).filter(Account.id == request.account_id).with_for_update().first()
+            # Time spent queued behind other transactions on this account's row lock.
+            with metrics.timer("debit_lock_wait"):
+                account = db.query(Account).filter(Account.id == request.account_id).with_for_update().first()
             
             if not account:
                 logger.warning(f"Account {request.account_id} not found")
@@ -76,11 +84,14 @@ def debit(request: TransactionRequest, db: Session = Depends(get_db)):
             
             logger.info(f"Debited {request.amount} from account {request.account_id}")
             
-            return {
+            response = {
                 "message": "Debit successful",
                 "new_balance": account.balance,
                 "currency": account.currency
             }
+            commit_started = time.perf_counter()
+        metrics.observe("debit_commit", time.perf_counter() - commit_started)
+        return response
     except SQLAlchemyError as e:
         logger.error(f"Database error during debit operation: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -89,7 +100,8 @@ def debit(request: TransactionRequest, db: Session = Depends(get_db)):
 def credit(request: TransactionRequest, db: Session = Depends(get_db)):
     try:
         with db.begin():
-            account = db.query(Account).filter(Account.id == request.account_id).with_for_update().first()
+            with metrics.timer("credit_lock_wait"):
+                account = db.query(Account).filter(Account.id == request.account_id).with_for_update().first()
             
             if not account:
                 logger.warning(f"Account {request.account_id} not found")
@@ -99,11 +111,14 @@ def credit(request: TransactionRequest, db: Session = Depends(get_db)):
             
             logger.info(f"Credited {request.amount} to account {request.account_id}")
             
-            return {
+            response = {
                 "message": "Credit successful",
                 "new_balance": account.balance,
                 "currency": account.currency
             }
+            commit_started = time.perf_counter()
+        metrics.observe("credit_commit", time.perf_counter() - commit_started)
+        return response
     except SQLAlchemyError as e:
         logger.error(f"Database error during credit operation: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -111,7 +126,8 @@ def credit(request: TransactionRequest, db: Session = Depends(get_db)):
 @app.get("/balance/{account_id}", response_model=Dict[str, Any])
 def get_balance(account_id: int, db: Session = Depends(get_db)):
     try:
-        account = db.query(Account).filter(Account.id == account_id).first()
+        with metrics.timer("balance_query"):
+            account = db.query(Account).filter(Account.id == account_id).first()
         
         if not account:
             logger.warning(f"Account {account_id} not found")
@@ -128,6 +144,10 @@ def get_balance(account_id: int, db: Session = Depends(get_db)):
         logger.error(f"Database error during balance query: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 
 if __name__ == "__main__":
     import uvicorn
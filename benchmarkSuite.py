@@ -0,0 +1,996 @@
+import argparse
+import asyncio
+import contextlib
+import glob
+import hashlib
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from instrumentation import QUANTILES, LatencyHistogram
+
+# Reproducible load benchmark for every service in the repo.
+#
+#   python benchmarkSuite.py run --baseline benchmark_baseline.json
+#
+# Everything runs locally: a stub Gemini endpoint (fixed answer, fixed
+# latency), a stub embedding service speaking embeddingService's socket
+# protocol (hashed bag-of-words vectors instead of a model) and a throwaway
+# Postgres cluster (initdb, or a postgres container when running as root).
+# Each (profile, service) pair gets a freshly started service, reseeded
+# tables and a fixed, seeded request sequence, so two runs on the same
+# machine issue exactly the same requests. Every response is checked.
+#
+# Results (throughput, p50/p95/p99 per service and per operation) are written
+# to a JSON file. With --baseline, the run fails (exit code 1) when a metric
+# is worse than the stored baseline by more than the configured threshold,
+# or when the baseline file is missing (unless --allow-missing-baseline);
+# --save-baseline records the run as the new baseline.
+#
+# The load generator is a pool of threads in this process, so numbers are
+# comparable between runs on the same machine, not across machines.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+STUB_LLM_TEXT = "Stub answer from the benchmark LLM."
+
+ACCOUNTS = 1000
+EMPLOYEES = 100
+SEED_DAYS = 20
+USERS = 1000
+SEED_DOCUMENTS = 20
+
+# Relative slowdowns that count as a regression: throughput may drop by 10%,
+# p50/p95/p99 may grow by 25/25/35%. Latency changes smaller than
+# min_latency_delta_ms and operations with fewer than min_requests samples
+# are ignored as noise. error_rate is an absolute increase. "overrides" holds
+# per "profile/service" replacements, e.g. {"hot-account/banking": {"p99": 0.5}}.
+DEFAULT_THRESHOLDS = {
+    "throughput": 0.10,
+    "p50": 0.25,
+    "p95": 0.25,
+    "p99": 0.35,
+    "error_rate": 0.01,
+    "min_latency_delta_ms": 1.0,
+    "min_requests": 100,
+    "overrides": {},
+}
+
+# keys: how many distinct accounts / employees / users the profile touches.
+# mix: relative weights of each service's operations.
+PROFILES = {
+    "read-heavy": {
+        "requests": 4000, "concurrency": 16, "keys": 1000,
+        "mix": {
+            "banking": {"balance": 9, "debit": 1},
+            "attendance": {"record": 6, "trends": 3, "add": 1},
+            "documentSearch": {"query": 6, "history": 2, "stats": 2},
+            "dispute": {"dispute_repeat": 1},
+            "portal": {"balance": 4, "dispute_history": 4, "eligibility": 2},
+        },
+    },
+    "write-heavy": {
+        "requests": 4000, "concurrency": 16, "keys": 1000,
+        "mix": {
+            "banking": {"debit": 5, "credit": 4, "balance": 1},
+            "attendance": {"add": 6, "update": 3, "record": 1},
+            "documentSearch": {"upload": 8, "query": 2},
+            "dispute": {"dispute_unique": 1},
+            "portal": {"eligibility": 8, "balance": 2},
+        },
+    },
+    "hot-account": {
+        "requests": 4000, "concurrency": 16, "keys": 1,
+        "mix": {
+            "banking": {"debit": 5, "credit": 4, "balance": 1},
+            "attendance": {"update": 8, "record": 2},
+            "documentSearch": {"query": 1},
+            "dispute": {"dispute_hot": 1},
+            "portal": {"balance": 5, "dispute_history": 5},
+        },
+    },
+    "bulk-ingest": {
+        "requests": 200, "concurrency": 4, "keys": 1000,
+        "mix": {
+            "banking": {"credit": 1},
+            "attendance": {"add": 1},
+            "documentSearch": {"upload_large": 1},
+            "dispute": {"dispute_batch": 1},
+            "portal": {"eligibility_batch": 1},
+        },
+    },
+}
+
+SERVICES = ("banking", "attendance", "documentSearch", "dispute", "portal")
+POSTGRES_SERVICES = {"banking": "banking", "attendance": "attendance", "portal": "portal"}
+LLM_SERVICES = ("attendance", "documentSearch")
+EMBEDDING_SERVICES = ("documentSearch", "dispute")
+
+DISPUTE_DESCRIPTIONS = [
+    "Someone used my card at a store I have never been to.",
+    "I was charged twice for my monthly subscription.",
+    "The package never arrived even though I paid for express shipping.",
+    "What is this pending charge from yesterday?",
+    "My bill shows a higher amount than the quoted price.",
+    "There is a transaction from another country that I did not make.",
+    "The hotel charged me for a night I cancelled.",
+    "The technician never showed up for the appointment I paid for.",
+]
+SEARCH_QUERIES = [
+    "How does ChromaDB work?",
+    "What are vector embeddings?",
+    "How to process PDF documents?",
+    "Explain similarity search",
+    "How to implement RAG?",
+    "What is the purpose of text splitting?",
+]
+WORDS = ("account balance ledger vector embedding chunk retrieval query index latency throughput "
+         "document search payment refund dispute merchant settlement policy customer report").split()
+
+
+# Stand-ins
+
+
+class HashingEncoder:
+    # Deterministic, model-free sentence embeddings: signed feature hashing
+    # of lower-cased words, L2-normalised. Similar texts still get similar
+    # vectors, so retrieval and classification exercise realistic code paths.
+    # weights_mb allocates (and touches) that much memory to stand in for the
+    # model's parameters when measuring resident memory.
+    def __init__(self, dim=EMBEDDING_DIM, latency=0.0, weights_mb=0):
+        self.dim = dim
+        self.latency = latency
+        self.weights = np.ones(weights_mb << 18, dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, sentences, batch_size=None, convert_to_numpy=True, **kwargs):
+        embeddings = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for row, text in enumerate(sentences):
+            for token in re.findall(r"\w+", text.lower()):
+                h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+                embeddings[row, h % self.dim] += 1.0 if h >> 63 else -1.0
+            embeddings[row, 0] += 1e-3  # keeps empty texts non-zero, whatever their batch position
+        if self.latency:
+            time.sleep(self.latency)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+class _StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+    latency = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.split("?")[0].endswith(":generateContent"):
+            self.send_error(404)
+            return
+        time.sleep(self.latency)
+        body = json.dumps({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": STUB_LLM_TEXT}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": 0, "totalTokenCount": 0},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_stub_llm(port, latency):
+    # Answers Gemini generateContent calls (any model) with STUB_LLM_TEXT.
+    handler = type("StubLLMHandler", (_StubLLMHandler,), {"latency": latency})
+    ThreadingHTTPServer(("127.0.0.1", port), handler).serve_forever()
+
+
+def serve_stub_embeddings(socket_path, latency, weights_mb=0):
+    import embeddingService
+
+    model = HashingEncoder(latency=latency, weights_mb=weights_mb)
+    asyncio.run(embeddingService.serve(MODEL_NAME, socket_path, 64, 0.002, model=model))
+
+
+def _port_open(port):
+    with socket.create_connection(("127.0.0.1", port), 1):
+        return True
+
+
+def _unix_socket_open(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        return True
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(predicate, timeout, what, process=None, log_path=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{what} exited with code {process.returncode}{_log_tail(log_path)}")
+        try:
+            if predicate():
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out after {timeout}s waiting for {what}{_log_tail(log_path)}")
+
+
+def _log_tail(path, lines=20):
+    if not path or not os.path.exists(path):
+        return ""
+    with open(path, errors="replace") as f:
+        return "\n" + "".join(f.readlines()[-lines:])
+
+
+class Process:
+    def __init__(self, name, command, cwd, env, log_path):
+        self.name = name
+        self.log_path = log_path
+        self.log = open(log_path, "w")
+        self.process = subprocess.Popen(command, cwd=cwd, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.log.close()
+
+
+class DisposablePostgres:
+    # A throwaway cluster with trust auth for the "bench" user. Uses the local
+    # initdb/pg_ctl when available (Postgres refuses to run as root), and a
+    # postgres:16 container otherwise. Everything is removed on exit.
+    IMAGE = "postgres:16"
+
+    def __init__(self, workdir, databases):
+        self.workdir = workdir
+        self.databases = databases
+        self.port = _free_port()
+        self.data_dir = os.path.join(workdir, "pgdata")
+        self.container = None
+        self.bindir = None
+
+    @staticmethod
+    def _pg_bindir():
+        if os.environ.get("PG_BIN"):
+            return os.environ["PG_BIN"]
+        if shutil.which("initdb"):
+            return os.path.dirname(shutil.which("initdb"))
+        if shutil.which("pg_config"):
+            bindir = subprocess.run(["pg_config", "--bindir"], capture_output=True, text=True).stdout.strip()
+            if os.path.exists(os.path.join(bindir, "initdb")):
+                return bindir
+        candidates = sorted(glob.glob("/usr/lib/postgresql/*/bin/initdb"))
+        return os.path.dirname(candidates[-1]) if candidates else None
+
+    def __enter__(self):
+        try:
+            self._start()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def _start(self):
+        bindir = self._pg_bindir()
+        if bindir and os.geteuid() != 0:
+            self.bindir = bindir
+            subprocess.run([os.path.join(bindir, "initdb"), "-D", self.data_dir, "-U", "bench", "-A", "trust",
+                            "-E", "UTF8", "--no-sync"], check=True, capture_output=True)
+            subprocess.run([os.path.join(bindir, "pg_ctl"), "-D", self.data_dir, "-l", os.path.join(self.workdir, "postgres.log"),
+                            "-w", "-o", f"-p {self.port} -k {self.workdir} -c listen_addresses=127.0.0.1", "start"],
+                           check=True, capture_output=True)
+        elif shutil.which("docker"):
+            self.container = subprocess.run(
+                ["docker", "run", "-d", "--rm", "-e", "POSTGRES_USER=bench", "-e", "POSTGRES_HOST_AUTH_METHOD=trust",
+                 "-p", f"127.0.0.1:{self.port}:5432", self.IMAGE],
+                check=True, capture_output=True, text=True).stdout.strip()
+        else:
+            raise RuntimeError("Need Postgres binaries (initdb/pg_ctl, as a non-root user) or Docker for the benchmark database")
+
+        import psycopg2
+
+        def connectable():
+            try:
+                psycopg2.connect(self.url("postgres")).close()
+                return True
+            except psycopg2.OperationalError:
+                return False
+
+        _wait_for(connectable, 60, "Postgres")
+        conn = psycopg2.connect(self.url("postgres"))
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            for database in self.databases:
+                cursor.execute(f"CREATE DATABASE {database}")
+        conn.close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.container:
+            subprocess.run(["docker", "stop", self.container], capture_output=True)
+        elif self.bindir and os.path.exists(os.path.join(self.data_dir, "postmaster.pid")):
+            subprocess.run([os.path.join(self.bindir, "pg_ctl"), "-D", self.data_dir, "-m", "immediate", "stop"],
+                           capture_output=True)
+        return False
+
+    def url(self, database, driver="postgresql"):
+        return f"{driver}://bench@127.0.0.1:{self.port}/{database}"
+
+
+# Services
+
+
+def service_command(service, port):
+    python = sys.executable
+    if service == "dispute":
+        return [python, os.path.join(ROOT, "customerDisputeAPI.py")]
+    app_dir, module = {
+        "banking": (ROOT, "bankingAPI"),
+        "attendance": (os.path.join(ROOT, "attendanceManager"), "api"),
+        "documentSearch": (os.path.join(ROOT, "documentSearch"), "api"),
+        "portal": (ROOT, "fullStackCustomerPortal"),
+    }[service]
+    return [python, "-m", "uvicorn", f"{module}:app", "--app-dir", app_dir,
+            "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+
+
+def service_env(service, port, stubs, postgres):
+    env = dict(os.environ)
+    # Keep the rate-limit middleware in the request path, but out of the way.
+    env["RATE_LIMIT_CONFIG"] = stubs["rate_limit_config"]
+    if service in POSTGRES_SERVICES:
+        database = POSTGRES_SERVICES[service]
+        if service == "banking":
+            env["DATABASE_URL"] = postgres.url(database, "postgresql+psycopg2")
+        elif service == "portal":
+            env["SUPABASE_URL"] = postgres.url(database)
+        else:
+            env["DATABASE_URL"] = postgres.url(database)
+    if service in LLM_SERVICES:
+        env["GEMINI_API_KEY"] = "benchmark"
+        env["GEMINI_BASE_URL"] = stubs["llm_url"]
+    if service in EMBEDDING_SERVICES:
+        env["EMBEDDING_SOCKET"] = stubs["embedding_socket"]
+        env["EMBEDDING_SERVICE"] = "auto"
+    if service == "dispute":
+        env["PORT"] = str(port)
+        env["MODEL_LOADING"] = "background"
+        env["INFERENCE_BACKEND"] = "torch"
+    return env
+
+
+READY_PATHS = {"dispute": "/health"}
+
+
+def seed_database(service, postgres):
+    # Runs after the service has started, so its own tables already exist.
+    # DELETE rather than TRUNCATE: attendanceManager keeps a transaction open
+    # on its shared connection, which would block TRUNCATE's exclusive lock.
+    if service not in POSTGRES_SERVICES:
+        return
+    import psycopg2
+    from psycopg2.extras import execute_values
+
+    conn = psycopg2.connect(postgres.url(POSTGRES_SERVICES[service]))
+    with conn, conn.cursor() as cursor:
+        if service == "banking":
+            cursor.execute("DELETE FROM accounts")
+            execute_values(cursor, "INSERT INTO accounts (id, balance, currency) VALUES %s",
+                           [(i, 1e12, "USD") for i in range(1, ACCOUNTS + 1)])
+        elif service == "attendance":
+            cursor.execute("DELETE FROM attendance")
+            statuses, departments = ("Present", "Absent", "WFH"), ("HR", "Engineering", "Sales")
+            execute_values(cursor, "INSERT INTO attendance (employee_id, date, status, department) VALUES %s",
+                           [(e, _seed_date(d), statuses[(e + d) % 3], departments[e % 3])
+                            for e in range(1, EMPLOYEES + 1) for d in range(SEED_DAYS)])
+        elif service == "portal":
+            cursor.execute("CREATE TABLE IF NOT EXISTS users (user_id INT PRIMARY KEY, "
+                           "account_balance DOUBLE PRECISION, dispute_history TEXT)")
+            cursor.execute("DELETE FROM users")
+            execute_values(cursor, "INSERT INTO users (user_id, account_balance, dispute_history) VALUES %s",
+                           [(i, 1000.0 + i, json.dumps([{"type": "Billing Error", "resolved": True}]))
+                            for i in range(1, USERS + 1)])
+    conn.close()
+
+
+def _seed_date(day):
+    return time.strftime("%Y-%m-%d", time.gmtime(1735689600 + day * 86400))  # from 2025-01-01
+
+
+def _document_text(seed, paragraphs):
+    rng = random.Random(seed)
+    return "\n\n".join(" ".join(rng.choice(WORDS) for _ in range(80)) + "." for _ in range(paragraphs))
+
+
+class Client:
+    # One keep-alive connection per thread.
+    def __init__(self, port, timeout=120):
+        self.port = port
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        for attempt in (0, 1):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # Server closed an idle keep-alive connection; retry once on a new one.
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+
+# Operations: each takes (rng, seq, keys) and returns
+# (method, path, body, headers, check); check(status, body) returns an error
+# message or None. seq is unique per request within a run, keys bounds the ids.
+
+
+def _json(payload):
+    return json.dumps(payload).encode(), {"Content-Type": "application/json"}
+
+
+def _expect(*fields, status=200):
+    def check(got_status, body):
+        if got_status != status:
+            return f"HTTP {got_status}: {body[:200]!r}"
+        data = json.loads(body)
+        missing = [f for f in fields if f not in data]
+        return f"missing {missing}" if missing else None
+    return check
+
+
+def _expect_ndjson(count):
+    def check(status, body):
+        if status != 200:
+            return f"HTTP {status}: {body[:200]!r}"
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        if len(lines) != count:
+            return f"expected {count} results, got {len(lines)}"
+        errors = [line for line in lines if "error" in line]
+        return f"{len(errors)} failed items" if errors else None
+    return check
+
+
+def _expect_llm(field):
+    def check(status, body):
+        if status != 200:
+            return f"HTTP {status}: {body[:200]!r}"
+        data = json.loads(body)
+        return None if data.get(field) == STUB_LLM_TEXT else f"unexpected {field}: {data.get(field)!r}"[:200]
+    return check
+
+
+def _multipart(filename, content):
+    boundary = "benchmark-boundary"
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: text/plain\r\n\r\n").encode() + content.encode() + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def _transaction(kind):
+    def op(rng, seq, keys):
+        body, headers = _json({"account_id": rng.randint(1, min(keys, ACCOUNTS)), "amount": round(rng.uniform(1, 100), 2)})
+        return "POST", f"/{kind}", body, headers, _expect("new_balance")
+    return op
+
+
+def _attendance_entry(rng, employee_id, date):
+    return _json({"employee_id": employee_id, "date": date, "status": rng.choice(["Present", "Absent", "WFH"]),
+                  "department": rng.choice(["HR", "Engineering", "Sales"])})
+
+
+def _attendance_add(rng, seq, keys):
+    # Dates after the seeded range, one per request, so inserts never collide.
+    body, headers = _attendance_entry(rng, rng.randint(1, min(keys, EMPLOYEES)), _seed_date(SEED_DAYS + seq))
+    return "POST", "/attendance/", body, headers, _expect("message")
+
+
+def _attendance_update(rng, seq, keys):
+    body, headers = _attendance_entry(rng, rng.randint(1, min(keys, EMPLOYEES)), _seed_date(rng.randrange(SEED_DAYS)))
+    return "PUT", "/attendance/", body, headers, _expect("message")
+
+
+def _insights(rng, seq, keys):
+    body, headers = _json({"user_query": "Who was absent most often?"})
+    return "POST", "/insights/", body, headers, _expect_llm("insights")
+
+
+def _upload(paragraphs):
+    def op(rng, seq, keys):
+        body, headers = _multipart(f"bench-{seq}.txt", _document_text(seq, paragraphs))
+        return "POST", "/upload/", body, headers, _expect("message")
+    return op
+
+
+def _search_query(rng, seq, keys):
+    def check(status, body):
+        error = _expect_llm("response")(status, body)
+        if error is None and not json.loads(body)["sources"]:
+            return "no sources retrieved"
+        return error
+    query = SEARCH_QUERIES[0] if keys == 1 else rng.choice(SEARCH_QUERIES)
+    body, headers = _json({"query": query})
+    return "POST", "/query/", body, headers, check
+
+
+def _dispute(description):
+    def op(rng, seq, keys):
+        body, headers = _json({"description": description(rng, seq), "transaction_amount": round(rng.uniform(5, 5000), 2),
+                               "customer_history": {"previous_disputes": rng.randint(0, 5)}})
+        return "POST", "/dispute", body, headers, _expect("dispute_type", "priority", "recommended_action")
+    return op
+
+
+def _dispute_batch(rng, seq, keys, size=500):
+    disputes = [{"description": f"{rng.choice(DISPUTE_DESCRIPTIONS)} Ref {seq}-{i}.",
+                 "transaction_amount": round(rng.uniform(5, 5000), 2)} for i in range(size)]
+    body = "\n".join(json.dumps(d) for d in disputes).encode()
+    return "POST", "/disputes/batch", body, {"Content-Type": "application/x-ndjson"}, _expect_ndjson(size)
+
+
+def _eligibility(rng, seq, keys):
+    def check(status, body):
+        error = _expect("score", "recommendation")(status, body)
+        if error is None and json.loads(body)["score"] not in (90, 70, 40):
+            return f"unexpected score {json.loads(body)['score']}"
+        return error
+    path = (f"/check_eligibility?income={rng.uniform(0, 150000):.2f}&credit_score={rng.randint(300, 850)}"
+            f"&loan_amount={rng.uniform(0, 1000000):.2f}")
+    return "POST", path, None, None, check
+
+
+def _eligibility_batch(rng, seq, keys, size=5000):
+    body, headers = _json([{"income": round(rng.uniform(0, 150000), 2), "credit_score": rng.randint(300, 850),
+                            "loan_amount": round(rng.uniform(0, 1000000), 2)} for _ in range(size)])
+    return "POST", "/check_eligibility/batch", body, headers, _expect_ndjson(size)
+
+
+def _get(path_for, *fields):
+    def op(rng, seq, keys):
+        return "GET", path_for(rng, keys), None, None, _expect(*fields)
+    return op
+
+
+OPERATIONS = {
+    "banking": {
+        "balance": _get(lambda rng, keys: f"/balance/{rng.randint(1, min(keys, ACCOUNTS))}", "balance"),
+        "debit": _transaction("debit"),
+        "credit": _transaction("credit"),
+    },
+    "attendance": {
+        "add": _attendance_add,
+        "update": _attendance_update,
+        # Every seeded employee has records, so "attendance" must be present.
+        "record": _get(lambda rng, keys: f"/attendance/{rng.randint(1, min(keys, EMPLOYEES))}", "attendance"),
+        "trends": _get(lambda rng, keys: "/attendance/trends", "attendance_trends"),
+        "insights": _insights,
+    },
+    "documentSearch": {
+        "query": _search_query,
+        "upload": _upload(4),
+        "upload_large": _upload(200),
+        "history": _get(lambda rng, keys: f"/analytics/queries?limit={rng.choice([10, 20, 50])}", "records"),
+        "stats": _get(lambda rng, keys: "/analytics/stats"),
+    },
+    "dispute": {
+        "dispute_repeat": _dispute(lambda rng, seq: rng.choice(DISPUTE_DESCRIPTIONS)),
+        "dispute_unique": _dispute(lambda rng, seq: f"{rng.choice(DISPUTE_DESCRIPTIONS)} Ref {seq}."),
+        "dispute_hot": _dispute(lambda rng, seq: DISPUTE_DESCRIPTIONS[0]),
+        "dispute_batch": _dispute_batch,
+    },
+    "portal": {
+        "balance": _get(lambda rng, keys: f"/get_balance/{rng.randint(1, min(keys, USERS))}", "account_balance"),
+        "dispute_history": _get(lambda rng, keys: f"/get_dispute_history/{rng.randint(1, min(keys, USERS))}",
+                                "dispute_history"),
+        "eligibility": _eligibility,
+        "eligibility_batch": _eligibility_batch,
+    },
+}
+
+def prepare(service, client, keys):
+    # Per-service setup over HTTP, after seed_database: documentSearch gets a
+    # small corpus so that queries retrieve something.
+    if service == "documentSearch":
+        for i in range(SEED_DOCUMENTS):
+            method, path, body, headers, check = _upload(4)(None, -1 - i, keys)
+            error = check(*client.request(method, path, body, headers))
+            if error:
+                raise RuntimeError(f"Seeding documentSearch failed: {error}")
+    if service == "attendance":
+        # Not part of any mix (its cost grows with the table); checked once here.
+        method, path, body, headers, check = _insights(None, 0, keys)
+        error = check(*client.request(method, path, body, headers))
+        if error:
+            raise RuntimeError(f"attendance /insights/ check failed: {error}")
+
+
+def run_workload(client, operations, mix, requests, concurrency, keys, seed, seq_offset=0):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    histograms = {name: LatencyHistogram() for name in names}
+    total = LatencyHistogram()
+    errors = {name: 0 for name in names}
+    samples = []
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(seed * 1000003 + index)
+        for seq in range(index, requests, concurrency):
+            name = rng.choices(names, weights)[0]
+            method, path, body, headers, check = operations[name](rng, seq_offset + seq, keys)
+            start = time.perf_counter()
+            try:
+                status, response = client.request(method, path, body, headers)
+                elapsed = time.perf_counter() - start
+                error = check(status, response)
+            except Exception as e:
+                elapsed = time.perf_counter() - start
+                error = f"{type(e).__name__}: {e}"
+            histograms[name].record(elapsed)
+            total.record(elapsed)
+            if error:
+                with lock:
+                    errors[name] += 1
+                    if len(samples) < 5:
+                        samples.append(f"{name} {method} {path}: {error}")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    def summarize(histogram, error_count):
+        return {
+            "requests": histogram.count,
+            "errors": error_count,
+            "error_rate": error_count / histogram.count if histogram.count else 0.0,
+            "throughput": histogram.count / elapsed,
+            **{f"p{int(q * 100)}_ms": round(histogram.quantile(q) * 1000, 3) for q in QUANTILES},
+        }
+
+    result = summarize(total, sum(errors.values()))
+    result["elapsed"] = round(elapsed, 3)
+    result["ops"] = {name: summarize(histograms[name], errors[name]) for name in names if histograms[name].count}
+    result["error_samples"] = samples
+    return result
+
+
+def scrape_stages(client):
+    # Server-side p50/p95/p99 per stage, from the service's /metrics.
+    status, body = client.request("GET", "/metrics")
+    stages = {}
+    if status != 200:
+        return stages
+    pattern = re.compile(r'stage_duration_quantile_seconds\{service="[^"]*",stage="([^"]*)",quantile="([^"]*)"\} (\S+)')
+    for match in pattern.finditer(body.decode()):
+        stage, quantile, value = match.groups()
+        stages.setdefault(stage, {})[f"p{int(float(quantile) * 100)}_ms"] = round(float(value) * 1000, 3)
+    return stages
+
+
+def run_service(service, profile_name, profile, stubs, postgres, workdir, seed, scale, warmup):
+    port = _free_port()
+    service_dir = os.path.join(workdir, profile_name, service)
+    os.makedirs(service_dir)
+    log_path = os.path.join(service_dir, "service.log")
+    process = Process(service, service_command(service, port), service_dir,
+                      service_env(service, port, stubs, postgres), log_path)
+    client = Client(port)
+    try:
+        ready_path = READY_PATHS.get(service, "/metrics")
+        _wait_for(lambda: client.request("GET", ready_path)[0] == 200, 300, f"{service} to become ready",
+                  process.process, log_path)
+        seed_database(service, postgres)
+        prepare(service, client, profile["keys"])
+        mix = profile["mix"][service]
+        requests = max(1, int(profile["requests"] * scale))
+        if warmup:
+            run_workload(client, OPERATIONS[service], mix, warmup, profile["concurrency"], profile["keys"], seed + 1,
+                         seq_offset=requests)
+        result = run_workload(client, OPERATIONS[service], mix, requests, profile["concurrency"], profile["keys"], seed)
+        result["workload"] = {"requests": requests, "concurrency": profile["concurrency"], "keys": profile["keys"],
+                              "mix": mix}
+        result["server_stages"] = scrape_stages(client)
+        return result
+    finally:
+        process.stop()
+
+
+# Resident memory of N workers with and without the shared embedding service
+
+
+def _rss_mb(pid="self"):
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+
+
+def _memory_worker(socket_path, weights_mb, results):
+    # One app worker: either a client of the shared service or its own model copy.
+    if socket_path:
+        import embeddingService
+
+        model = embeddingService.EmbeddingClient(MODEL_NAME, socket_path)
+    else:
+        model = HashingEncoder(weights_mb=weights_mb)
+    model.encode(DISPUTE_DESCRIPTIONS * 8)
+    results.put(_rss_mb())
+
+
+def check_shared_memory(workers, weights_mb):
+    # Total resident memory of `workers` processes that each load a model of
+    # weights_mb, against the same workers using one shared embedding service.
+    # Uses the stand-in model, so it shows the per-copy saving only; real
+    # workers also skip importing torch (~hundreds of MiB) in shared mode.
+    import multiprocessing
+
+    if not os.path.exists("/proc/self/statm"):
+        raise RuntimeError("The memory check reads /proc and needs Linux")
+    context = multiprocessing.get_context("spawn")
+    usage = {}
+    for mode in ("in-process", "shared"):
+        service = socket_path = None
+        if mode == "shared":
+            socket_path = os.path.join(tempfile.mkdtemp(prefix="bench-memory-"), "embeddings.sock")
+            service = context.Process(target=serve_stub_embeddings, args=(socket_path, 0.0, weights_mb), daemon=True)
+            service.start()
+            _wait_for(lambda: _unix_socket_open(socket_path), 30, "stub embedding service")
+        try:
+            results = context.Queue()
+            processes = [context.Process(target=_memory_worker, args=(socket_path, weights_mb, results))
+                         for _ in range(workers)]
+            for process in processes:
+                process.start()
+            worker_rss = [results.get(timeout=60) for _ in processes]
+            for process in processes:
+                process.join()
+            service_rss = _rss_mb(service.pid) if service else 0.0
+        finally:
+            if service:
+                service.terminate()
+                service.join()
+                shutil.rmtree(os.path.dirname(socket_path), ignore_errors=True)
+        usage[mode] = {"workers": worker_rss, "service": service_rss, "total": service_rss + sum(worker_rss)}
+        print(f"{mode:<10} {workers} workers {sum(worker_rss):8.1f} MiB + service {service_rss:7.1f} MiB "
+              f"= {usage[mode]['total']:8.1f} MiB")
+    print(f"shared saves {usage['in-process']['total'] - usage['shared']['total']:.1f} MiB "
+          f"(model stand-in: {weights_mb} MiB per copy)")
+    return usage
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(profiles, services, seed, scale, warmup, llm_latency, embedding_latency, keep_workdir=False):
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    with contextlib.ExitStack() as stack:
+        if keep_workdir:
+            stack.callback(print, f"Logs and data kept in {workdir}")
+        else:
+            stack.callback(shutil.rmtree, workdir, ignore_errors=True)
+
+        stubs = {"rate_limit_config": os.path.join(workdir, "rate_limits.json")}
+        with open(stubs["rate_limit_config"], "w") as f:
+            json.dump({"key": "route", "default": {"max_requests": 10 ** 9, "time_window": 60}}, f)
+
+        if any(s in LLM_SERVICES for s in services):
+            llm_port = _free_port()
+            stubs["llm_url"] = f"http://127.0.0.1:{llm_port}/"
+            log_path = os.path.join(workdir, "stub-llm.log")
+            stub = Process("stub-llm", [sys.executable, os.path.abspath(__file__), "stub-llm", "--port", str(llm_port),
+                                        "--latency-ms", str(llm_latency * 1000)], workdir, dict(os.environ), log_path)
+            stack.callback(stub.stop)
+            _wait_for(lambda: _port_open(llm_port), 30, "stub LLM", stub.process, log_path)
+        if any(s in EMBEDDING_SERVICES for s in services):
+            stubs["embedding_socket"] = os.path.join(workdir, "embeddings.sock")
+            log_path = os.path.join(workdir, "stub-embeddings.log")
+            stub = Process("stub-embeddings", [sys.executable, os.path.abspath(__file__), "stub-embeddings",
+                                               "--socket", stubs["embedding_socket"],
+                                               "--latency-ms", str(embedding_latency * 1000)],
+                           workdir, dict(os.environ), log_path)
+            stack.callback(stub.stop)
+            _wait_for(lambda: os.path.exists(stubs["embedding_socket"]), 30, "stub embedding service",
+                      stub.process, log_path)
+
+        databases = sorted({POSTGRES_SERVICES[s] for s in services if s in POSTGRES_SERVICES})
+        postgres = stack.enter_context(DisposablePostgres(workdir, databases)) if databases else None
+
+        results = {}
+        for profile_name in profiles:
+            profile = PROFILES[profile_name]
+            results[profile_name] = {}
+            for service in services:
+                print(f"{profile_name:<12} {service:<15}", end="", flush=True)
+                result = run_service(service, profile_name, profile, stubs, postgres, workdir, seed, scale, warmup)
+                results[profile_name][service] = result
+                print(f"{result['throughput']:9.1f} req/s   p50 {result['p50_ms']:8.2f} ms   "
+                      f"p95 {result['p95_ms']:8.2f} ms   p99 {result['p99_ms']:8.2f} ms   errors {result['errors']}")
+                for sample in result["error_samples"]:
+                    print(f"    {sample}")
+        return {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "seed": seed,
+                "scale": scale,
+                "warmup": warmup,
+                "llm_latency_ms": llm_latency * 1000,
+                "embedding_latency_ms": embedding_latency * 1000,
+            },
+            "results": results,
+        }
+
+
+def load_thresholds(path=None):
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if path:
+        with open(path) as f:
+            thresholds.update(json.load(f))
+    return thresholds
+
+
+def compare(current, baseline, thresholds):
+    # Returns a list of human-readable regressions; empty means the run passes.
+    regressions = []
+
+    def check(label, result, base, limits):
+        if base["throughput"] and result["throughput"] < base["throughput"] * (1 - limits["throughput"]):
+            regressions.append(f"{label}: throughput {result['throughput']:.1f} req/s vs baseline {base['throughput']:.1f}")
+        for p in ("p50", "p95", "p99"):
+            now, before = result[f"{p}_ms"], base[f"{p}_ms"]
+            if now > before * (1 + limits[p]) and now - before > limits["min_latency_delta_ms"]:
+                regressions.append(f"{label}: {p} {now:.2f} ms vs baseline {before:.2f} ms")
+        if result["error_rate"] - base["error_rate"] > limits["error_rate"]:
+            regressions.append(f"{label}: error rate {result['error_rate']:.2%} vs baseline {base['error_rate']:.2%}")
+
+    for profile, services in current["results"].items():
+        for service, result in services.items():
+            base = baseline["results"].get(profile, {}).get(service)
+            label = f"{profile}/{service}"
+            if base is None:
+                print(f"{label}: not in baseline, skipped")
+                continue
+            if base["workload"] != result["workload"]:
+                regressions.append(f"{label}: workload differs from baseline; re-record it with --save-baseline")
+                continue
+            limits = {**thresholds, **thresholds["overrides"].get(label, {})}
+            check(label, result, base, limits)
+            for op, op_result in result["ops"].items():
+                base_op = base["ops"].get(op)
+                if base_op and min(op_result["requests"], base_op["requests"]) >= limits["min_requests"]:
+                    check(f"{label}/{op}", op_result, base_op, limits)
+    return regressions
+
+
+def gate(current, baseline_path, thresholds_path, allow_missing_baseline=False):
+    if not os.path.exists(baseline_path):
+        if allow_missing_baseline:
+            print(f"No baseline at {baseline_path}; nothing to compare against")
+            return 0
+        print(f"No baseline at {baseline_path}; record one with --save-baseline "
+              f"or pass --allow-missing-baseline")
+        return 1
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, load_thresholds(thresholds_path))
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {baseline_path}")
+        return 1
+    print(f"No regressions against {baseline_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproducible load benchmark with local stand-ins and regression gates")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Run workload profiles against locally started services")
+    run_parser.add_argument("--profiles", default=",".join(PROFILES), help="Comma-separated profiles")
+    run_parser.add_argument("--services", default=",".join(SERVICES), help="Comma-separated services")
+    run_parser.add_argument("--output", default="benchmark_results.json")
+    run_parser.add_argument("--baseline", help="Fail if the run regresses against this results file")
+    run_parser.add_argument("--thresholds", help="JSON file overriding DEFAULT_THRESHOLDS")
+    run_parser.add_argument("--save-baseline", action="store_true", help="Write this run to --baseline instead of comparing")
+    run_parser.add_argument("--allow-missing-baseline", action="store_true",
+                            help="Pass instead of failing when --baseline does not exist yet")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--scale", type=float, default=1.0, help="Multiplier on each profile's request count")
+    run_parser.add_argument("--warmup", type=int, default=50, help="Unmeasured requests per service before each run")
+    run_parser.add_argument("--llm-latency-ms", type=float, default=20.0)
+    run_parser.add_argument("--embedding-latency-ms", type=float, default=0.0)
+    run_parser.add_argument("--keep-workdir", action="store_true", help="Keep service logs and data for inspection")
+    compare_parser = subparsers.add_parser("compare", help="Compare a results file against a baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--thresholds")
+    compare_parser.add_argument("--allow-missing-baseline", action="store_true",
+                                help="Pass instead of failing when the baseline does not exist yet")
+    llm_parser = subparsers.add_parser("stub-llm", help="Serve the stub Gemini endpoint")
+    llm_parser.add_argument("--port", type=int, default=8089)
+    llm_parser.add_argument("--latency-ms", type=float, default=20.0)
+    embedding_parser = subparsers.add_parser("stub-embeddings", help="Serve stub embeddings on the embedding-service socket")
+    embedding_parser.add_argument("--socket", required=True)
+    embedding_parser.add_argument("--latency-ms", type=float, default=0.0)
+    memory_parser = subparsers.add_parser("memory", help="Compare worker RSS with and without the shared embedding service")
+    memory_parser.add_argument("--workers", type=int, default=4)
+    memory_parser.add_argument("--weights-mb", type=int, default=90, help="Stand-in model size (all-MiniLM-L6-v2 is ~90 MiB)")
+    args = parser.parse_args()
+
+    if args.command == "stub-llm":
+        serve_stub_llm(args.port, args.latency_ms / 1000)
+    elif args.command == "stub-embeddings":
+        serve_stub_embeddings(args.socket, args.latency_ms / 1000)
+    elif args.command == "memory":
+        usage = check_shared_memory(args.workers, args.weights_mb)
+        if usage["shared"]["total"] >= usage["in-process"]["total"]:
+            sys.exit("The shared embedding service did not reduce total resident memory")
+    elif args.command == "compare":
+        with open(args.results) as f:
+            results = json.load(f)
+        sys.exit(gate(results, args.baseline, args.thresholds, args.allow_missing_baseline))
+    else:
+        profiles = [p for p in args.profiles.split(",") if p]
+        services = [s for s in args.services.split(",") if s]
+        unknown = [p for p in profiles if p not in PROFILES] + [s for s in services if s not in SERVICES]
+        if unknown:
+            parser.error(f"Unknown profiles/services: {', '.join(unknown)}")
+        if args.save_baseline and not args.baseline:
+            parser.error("--save-baseline needs --baseline to say where to write it")
+
+        results = run(profiles, services, args.seed, args.scale, args.warmup,
+                      args.llm_latency_ms / 1000, args.embedding_latency_ms / 1000, args.keep_workdir)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+        if args.save_baseline:
+            shutil.copyfile(args.output, args.baseline)
+            print(f"Baseline saved to {args.baseline}")
+        elif args.baseline:
+            sys.exit(gate(results, args.baseline, args.thresholds, args.allow_missing_baseline))
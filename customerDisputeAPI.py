@@ -1,66 +1,597 @@
-from flask import Flask, request, jsonify, abort
-from sentence_transformers import SentenceTransformer, util
+from flask import Flask, Response, request, jsonify, abort, stream_with_context
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import OrderedDict
+import numpy as np
+import contextlib
+import threading
+import argparse
+import hashlib
 import logging
+import atexit
+import itertools
+import csv
+import sys
+import queue
+import json
 import time
 import os
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from rateLimitMiddleware import RateLimitPolicy, WSGIRateLimitMiddleware
+import embeddingService
+from instrumentation import Metrics, PROMETHEUS_CONTENT_TYPE
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('dispute-api')
 
 app = Flask(__name__)
+metrics = Metrics("customerDispute")
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_CONTENT_LENGTH", 16 * 1024 * 1024))
+
+# Per-route limits; override with a JSON file via RATE_LIMIT_CONFIG.
+# Every /dispute call runs the sentence transformer.
+RATE_LIMITS = {
+    "key": "ip",
+    "routes": {
+        "/dispute": {"max_requests": 60, "time_window": 60},
+        "/disputes/batch": {"max_requests": 10, "time_window": 60},
+    },
+}
+app.wsgi_app = WSGIRateLimitMiddleware(app.wsgi_app, RateLimitPolicy.from_env(RATE_LIMITS))
 
 MODEL_NAME = "all-MiniLM-L6-v2"
+# torch: fp32 PyTorch. int8: PyTorch with dynamically quantised Linear layers.
+# onnx: ONNX Runtime export (needs sentence-transformers[onnx]).
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+# eager: load at import. background: load in a thread, /health reports when ready.
+# lazy: load on the first request that needs the model.
+MODEL_LOADING = os.environ.get("MODEL_LOADING", "background")
+MODEL_READY_TIMEOUT = float(os.environ.get("MODEL_READY_TIMEOUT", 30))
+CATEGORY_CACHE_DIR = os.environ.get("CATEGORY_CACHE_DIR", ".category_cache")
 
-print(f"Loading model {MODEL_NAME}...")
-start = time.time()
-model = SentenceTransformer(MODEL_NAME)
-print(f"Model loaded in {time.time() - start:.2f} seconds")
+model = None
+model_ready = threading.Event()
+model_load_finished = threading.Event()  # set on success or failure
+model_load_lock = threading.Lock()
+model_load_error = None
+model_load_seconds = None
 
+# Built-in categories, used when DISPUTE_CATEGORIES_FILE does not exist. The
+# file has the same shape ({"category": ["example phrasing", ...]}) and is
+# re-read whenever it changes, without restarting the service.
 DISPUTE_CATEGORIES = {
-    "Fraud": "Unauthorized transaction detected on my account.",
-    "Billing Error": "Incorrect charge or double charge on my bill.",
-    "Service Issue": "Service was not delivered as promised.",
-    "General Inquiry": "I have a question about my transaction.",
+    "Fraud": [
+        "Unauthorized transaction detected on my account.",
+        "I did not make this purchase, someone used my card.",
+        "My card was stolen and charged without my permission.",
+        "There are transactions I don't recognize on my statement.",
+    ],
+    "Billing Error": [
+        "Incorrect charge or double charge on my bill.",
+        "I was charged twice for the same order.",
+        "The amount charged is different from the price I agreed to.",
+        "I was still billed after cancelling my subscription.",
+    ],
+    "Service Issue": [
+        "Service was not delivered as promised.",
+        "I never received the item I paid for.",
+        "The product arrived damaged and the merchant won't help.",
+        "The merchant did not provide the service I was charged for.",
+    ],
+    "General Inquiry": [
+        "I have a question about my transaction.",
+        "Can you explain what this charge is for?",
+        "How long does a refund usually take?",
+    ],
 }
+DISPUTE_CATEGORIES_FILE = os.environ.get("DISPUTE_CATEGORIES_FILE", "dispute_categories.json")
+CATEGORY_AGGREGATION = os.environ.get("CATEGORY_AGGREGATION", "max")
+CATEGORY_RELOAD_INTERVAL = 5.0
+DEFAULT_TOP_K = 3
+
+
+class CategoryIndex:
+    # All exemplar embeddings of all categories in one L2-normalised matrix,
+    # grouped by category, so scoring a description is a single matrix-vector
+    # product followed by a per-category max (or mean) over each group.
+    def __init__(self, categories, aggregation="max", encoder=None, backend=INFERENCE_BACKEND):
+        if aggregation not in ("max", "mean"):
+            raise ValueError(f"Unknown category aggregation: {aggregation!r}")
+
+        self.names = list(categories)
+        if not self.names:
+            raise ValueError("No dispute categories defined")
+        exemplars = []
+        counts = []
+        for name in self.names:
+            phrases = categories[name]
+            if isinstance(phrases, str):
+                phrases = [phrases]
+            # reduceat needs at least one exemplar per group: an empty one would
+            # silently take its neighbour's first score (or fall off the end).
+            if not phrases or not all(isinstance(p, str) and p.strip() for p in phrases):
+                raise ValueError(f"Dispute category {name!r} needs a non-empty list of example phrasings")
+            exemplars.extend(phrases)
+            counts.append(len(phrases))
+
+        self.aggregation = aggregation
+        self.counts = np.array(counts)
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)[:-1]))
+        self.matrix = self._encode_exemplars(exemplars, encoder or model, backend)
+
+    @staticmethod
+    def _encode_exemplars(exemplars, encoder, backend):
+        # Exemplar embeddings are cached on disk per model, backend and exemplar
+        # list, so a restart with unchanged categories skips encoding them.
+        cache_path = None
+        if CATEGORY_CACHE_DIR:
+            key = hashlib.sha256(json.dumps([MODEL_NAME, backend, exemplars]).encode()).hexdigest()[:16]
+            cache_path = os.path.join(CATEGORY_CACHE_DIR, f"{key}.npy")
+            if os.path.exists(cache_path):
+                try:
+                    matrix = np.load(cache_path)
+                    if matrix.shape[0] == len(exemplars):
+                        return matrix
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Ignoring unreadable category cache {cache_path}: {str(e)}")
+
+        matrix = encoder.encode(exemplars, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+        if cache_path:
+            # Written under a per-process name and renamed into place, so a
+            # worker starting at the same time never loads a partial file.
+            os.makedirs(CATEGORY_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, matrix)
+            os.replace(tmp_path, cache_path)
+        return matrix
+
+    def scores(self, embeddings):
+        # embeddings: (dim,) or (n, dim), normalised. Returns (n_categories,) or (n, n_categories).
+        similarities = embeddings @ self.matrix.T
+        if self.aggregation == "max":
+            return np.maximum.reduceat(similarities, self.offsets, axis=-1)
+        return np.add.reduceat(similarities, self.offsets, axis=-1) / self.counts
+
+    def top_k(self, embedding, k):
+        scores = self.scores(embedding)
+        best = np.argsort(-scores)[:k]
+        return [(self.names[i], float(scores[i])) for i in best]
+
+
+def load_categories():
+    if os.path.exists(DISPUTE_CATEGORIES_FILE):
+        with open(DISPUTE_CATEGORIES_FILE) as f:
+            return json.load(f), os.path.getmtime(DISPUTE_CATEGORIES_FILE)
+    return DISPUTE_CATEGORIES, None
+
+
+category_index = None
+categories_mtime = None
+category_reload_lock = threading.Lock()
+category_checked_at = time.time()
+
+
+def get_category_index():
+    # A changed file is re-encoded on a background thread; requests keep using
+    # the current index until the new one is swapped in.
+    global category_checked_at
+    now = time.time()
+    if now - category_checked_at < CATEGORY_RELOAD_INTERVAL or not category_reload_lock.acquire(blocking=False):
+        return category_index
+    category_checked_at = now
+    mtime = os.path.getmtime(DISPUTE_CATEGORIES_FILE) if os.path.exists(DISPUTE_CATEGORIES_FILE) else None
+    if mtime == categories_mtime:
+        category_reload_lock.release()
+    else:
+        # The lock stays held until the reload thread is done, so only one runs at a time.
+        threading.Thread(target=reload_categories, args=(mtime,), name="category-reload", daemon=True).start()
+    return category_index
+
 
-category_embeddings = {}
-for category, desc in DISPUTE_CATEGORIES.items():
-    category_embeddings[category] = model.encode(desc)
+def reload_categories(mtime):
+    global category_index, categories_mtime
+    try:
+        new_categories, mtime = load_categories()
+        category_index = CategoryIndex(new_categories, CATEGORY_AGGREGATION)
+        logger.info(f"Reloaded {len(category_index.names)} dispute categories from {DISPUTE_CATEGORIES_FILE}")
+    except Exception as e:
+        logger.error(f"Failed to reload dispute categories, keeping previous set: {str(e)}")
+    finally:
+        categories_mtime = mtime
+        category_reload_lock.release()
 
 MEDIUM_THRESHOLD = 1000
 HIGH_THRESHOLD = 5000
 
+MICRO_BATCHING = os.environ.get("MICRO_BATCHING", "true").lower() == "true"
+ENCODE_BATCH_SIZE = int(os.environ.get("ENCODE_BATCH_SIZE", 32))
+ENCODE_MAX_WAIT_MS = float(os.environ.get("ENCODE_MAX_WAIT_MS", 5))
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 50000))
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH")
+
+
+def encode_texts(texts):
+    return model.encode(texts, batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=True)
+
+
+class EncodeBatcher:
+    # Concurrent requests each submit one description; a single worker thread
+    # collects them for up to max_wait seconds or max_batch_size items and
+    # encodes the lot in one model.encode call.
+    def __init__(self, encode_fn, max_batch_size=ENCODE_BATCH_SIZE, max_wait=ENCODE_MAX_WAIT_MS / 1000):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.pending = queue.Queue()
+        self.worker = threading.Thread(target=self._run, name="encode-batcher", daemon=True)
+        self.worker.start()
+
+    def submit(self, text):
+        future = Future()
+        self.pending.put((text, future))
+        return future
+
+    def encode(self, text):
+        return self.submit(text).result()
+
+    def _run(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self.pending.get(timeout=remaining) if remaining > 0 else self.pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                embeddings = self.encode_fn([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+
+encode_batcher = None
+
+
+def normalize_description(description):
+    # The model is uncased, so case and whitespace differences never change the embedding.
+    return " ".join(description.lower().split())
+
+
+class EmbeddingCache:
+    # LRU cache of description embeddings keyed on normalised text. Vectors
+    # live in a fixed (capacity, dim) float32 array; with a path, that array
+    # and a per-slot key digest are memory-mapped files and the key -> slot
+    # index is saved as JSON, so a restarted pod starts warm.
+    #
+    # Every worker process on a host maps the same files but keeps its own
+    # key -> slot index, so another worker may reuse a slot behind our back.
+    # Access to the files is serialised with an flock, and a slot is only
+    # trusted while it still holds the key's digest.
+    SAVE_EVERY = 1000
+
+    def __init__(self, capacity, dim, path=None):
+        if path and fcntl is None:
+            logger.warning("Persistent embedding cache needs fcntl; keeping it in memory")
+            path = None
+        self.capacity = capacity
+        self.dim = dim
+        self.path = path
+        self.lock = threading.Lock()
+        self.slots = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.unsaved = 0
+        self.lock_fd = None
+
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self.lock_fd = os.open(os.path.join(path, "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            with self._shared_files(exclusive=True):
+                self.vectors = self._open_memmap("vectors.f32", np.float32, (capacity, dim))
+                self.digests = self._open_memmap("digests.u64", np.uint64, (capacity,))
+                self._load_index()
+        else:
+            self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+            self.digests = np.zeros(capacity, dtype=np.uint64)
+        used = set(self.slots.values())
+        self.free = [slot for slot in range(capacity - 1, -1, -1) if slot not in used]
+
+    def _open_memmap(self, name, dtype, shape):
+        file_path = os.path.join(self.path, name)
+        expected = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        mode = "r+" if os.path.exists(file_path) and os.path.getsize(file_path) == expected else "w+"
+        return np.memmap(file_path, dtype=dtype, mode=mode, shape=shape)
+
+    @contextlib.contextmanager
+    def _shared_files(self, exclusive=False):
+        if self.lock_fd is None:
+            yield
+            return
+        fcntl.flock(self.lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _digest(key):
+        return np.uint64(int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little"))
+
+    def _valid_entries(self, entries):
+        return [(key, slot) for key, slot in entries
+                if 0 <= slot < self.capacity and self.digests[slot] == self._digest(key)]
+
+    def _read_index(self):
+        index_path = os.path.join(self.path, "index.json")
+        if not os.path.exists(index_path):
+            return []
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable embedding cache index: {str(e)}")
+            return []
+        if index.get("dim") != self.dim:
+            return []
+        return index.get("entries", [])
+
+    def _load_index(self):
+        self.slots.update(self._valid_entries(self._read_index()))
+        logger.info(f"Loaded {len(self.slots)} cached embeddings from {self.path}")
+
+    def get(self, key):
+        with self.lock:
+            slot = self.slots.get(key)
+            embedding = None
+            if slot is not None:
+                with self._shared_files():
+                    if self.digests[slot] == self._digest(key):
+                        embedding = np.array(self.vectors[slot])
+                if embedding is None:
+                    # Reused by another worker; the slot is no longer ours to free.
+                    del self.slots[key]
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.slots.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def _take_slot(self, digest):
+        while self.free:
+            slot = self.free.pop()
+            if not self.digests[slot]:  # skip slots another worker has filled since
+                return slot
+        if self.slots:
+            return self.slots.popitem(last=False)[1]
+        return int(digest % np.uint64(self.capacity))
+
+    def put(self, key, embedding):
+        with self.lock:
+            if key in self.slots:
+                return
+            digest = self._digest(key)
+            with self._shared_files(exclusive=True):
+                slot = self._take_slot(digest)
+                self.vectors[slot] = embedding
+                self.digests[slot] = digest
+            self.slots[key] = slot
+            self.unsaved += 1
+            if self.path and self.unsaved >= self.SAVE_EVERY:
+                self._save()
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        # Merges with the entries other workers saved, keeping whichever key
+        # each slot currently holds.
+        with self._shared_files(exclusive=True):
+            self.vectors.flush()
+            self.digests.flush()
+            entries = dict(self._read_index())
+            entries.update(self.slots)
+            index_path = os.path.join(self.path, "index.json")
+            tmp_path = f"{index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"dim": self.dim, "entries": self._valid_entries(entries.items())}, f)
+            os.replace(tmp_path, index_path)
+        self.unsaved = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.slots),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "persistent": bool(self.path),
+            }
+
+
+embedding_cache = None
+
+
+def load_model(backend=INFERENCE_BACKEND, use_service=True):
+    if backend == "torch" and use_service:
+        # The shared embedding service serves the fp32 model; fall back to loading it here.
+        shared = embeddingService.connect(MODEL_NAME)
+        if shared is not None:
+            return shared
+
+    # Imported here so that workers using the shared service never load torch.
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        return SentenceTransformer(MODEL_NAME, backend="onnx")
+    loaded = SentenceTransformer(MODEL_NAME)
+    if backend == "int8":
+        import torch
+
+        loaded = torch.quantization.quantize_dynamic(loaded, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend != "torch":
+        raise ValueError(f"Unknown inference backend: {backend!r}")
+    return loaded
+
+
+def initialize():
+    # Loads the model and everything derived from it. Safe to call from any
+    # thread; only the first call does the work.
+    global model, category_index, categories_mtime, encode_batcher, embedding_cache
+    global model_load_error, model_load_seconds
+    with model_load_lock:
+        if model_ready.is_set() or model_load_error is not None:
+            return
+        try:
+            start = time.time()
+            logger.info(f"Loading model {MODEL_NAME} ({INFERENCE_BACKEND} backend)...")
+            model = load_model()
+
+            categories, categories_mtime = load_categories()
+            category_index = CategoryIndex(categories, CATEGORY_AGGREGATION)
+            if MICRO_BATCHING:
+                encode_batcher = EncodeBatcher(encode_texts)
+            if EMBEDDING_CACHE_SIZE > 0:
+                # Different backends give slightly different vectors, so they never share a cache.
+                cache_path = os.path.join(EMBEDDING_CACHE_PATH, INFERENCE_BACKEND) if EMBEDDING_CACHE_PATH else None
+                embedding_cache = EmbeddingCache(EMBEDDING_CACHE_SIZE, model.get_sentence_embedding_dimension(), cache_path)
+                atexit.register(embedding_cache.save)
+
+            model_load_seconds = time.time() - start
+            metrics.observe("model_load", model_load_seconds)
+            logger.info(f"Model ready in {model_load_seconds:.2f} seconds")
+            model_ready.set()
+        except Exception as e:
+            model_load_error = str(e)
+            logger.error(f"Failed to load model: {model_load_error}")
+        finally:
+            model_load_finished.set()
+
+
+def start_initialization():
+    threading.Thread(target=initialize, name="model-loader", daemon=True).start()
+
+
+def wait_until_ready(timeout=MODEL_READY_TIMEOUT):
+    # A failed load is final, so requests fail fast instead of holding a
+    # worker thread for the whole timeout.
+    if model_load_error is not None:
+        return False
+    if not model_ready.is_set() and MODEL_LOADING == "lazy" and not model_load_lock.locked():
+        start_initialization()
+    model_load_finished.wait(timeout)
+    return model_ready.is_set()
+
+
+def start_model_loading():
+    if MODEL_LOADING == "eager":
+        initialize()
+    elif MODEL_LOADING == "background":
+        start_initialization()
+
+
+# When run as a script, __main__ decides (the offline commands load eagerly or not at all).
+if __name__ != "__main__":
+    start_model_loading()
+
+
+def not_ready_response():
+    if model_load_error is not None:
+        return jsonify({"error": "Model failed to load"}), 503
+    response = jsonify({"error": "Model is still loading"})
+    response.headers["Retry-After"] = "5"
+    return response, 503
+
+
+def encode_description(description):
+    key = normalize_description(description)
+    if embedding_cache is not None:
+        embedding = embedding_cache.get(key)
+        if embedding is not None:
+            return embedding
+
+    if encode_batcher is not None:
+        embedding = encode_batcher.encode(description)
+    else:
+        embedding = encode_texts([description])[0]
+
+    if embedding_cache is not None:
+        embedding_cache.put(key, embedding)
+    return embedding
+
+
+def encode_descriptions(descriptions):
+    # Batch counterpart of encode_description: only distinct cache misses reach the model.
+    if embedding_cache is None:
+        return encode_texts(descriptions)
+
+    embeddings = [None] * len(descriptions)
+    missing = OrderedDict()
+    for i, description in enumerate(descriptions):
+        key = normalize_description(description)
+        embedding = embedding_cache.get(key)
+        if embedding is None:
+            missing.setdefault(key, []).append(i)
+        else:
+            embeddings[i] = embedding
+
+    if missing:
+        encoded = encode_texts([descriptions[positions[0]] for positions in missing.values()])
+        for (key, positions), embedding in zip(missing.items(), encoded):
+            embedding_cache.put(key, embedding)
+            for i in positions:
+                embeddings[i] = embedding
+    return np.stack(embeddings)
+
 
 def classify_dispute(description, amount, customer_history=None):
+    best_category, priority, _ = classify_dispute_ranked(description, amount, customer_history)
+    return best_category, priority
+
+
+def classify_dispute_ranked(description, amount, customer_history=None, top_k=DEFAULT_TOP_K):
     if not description:
         logger.warning("Empty dispute description received")
-        return "General Inquiry", "Low"
-    
-    text_embedding = model.encode(description)
-    
-    best_category = None
-    best_score = -1
-    
-    for category, embedding in category_embeddings.items():
-        similarity = float(util.cos_sim(text_embedding, embedding)[0][0])
-        if similarity > best_score:
-            best_score = similarity
-            best_category = category
+        return "General Inquiry", "Low", []
     
-    if best_category == "Fraud" or amount > HIGH_THRESHOLD:
-        priority = "High"
-    elif best_category == "Billing Error" and amount > MEDIUM_THRESHOLD:
-        priority = "Medium"
-    elif best_category == "Service Issue":
-        priority = "Medium" if amount > MEDIUM_THRESHOLD / 2 else "Low"
-    else:
-        priority = "Low"
+    with metrics.timer("dispute_encode"):
+        text_embedding = encode_description(description)
+    with metrics.timer("dispute_scoring"):
+        top_categories = get_category_index().top_k(text_embedding, max(1, top_k))
+    best_category = top_categories[0][0]
+    priority = base_priority(best_category, amount)
     
     if customer_history:
         priority = adjust_priority_by_history(best_category, priority, customer_history)
         
     logger.info(f"Classified as {best_category} (priority: {priority})")
-    return best_category, priority
+    return best_category, priority, top_categories
+
+
+def base_priority(category, amount):
+    if category == "Fraud" or amount > HIGH_THRESHOLD:
+        return "High"
+    elif category == "Billing Error" and amount > MEDIUM_THRESHOLD:
+        return "Medium"
+    elif category == "Service Issue":
+        return "Medium" if amount > MEDIUM_THRESHOLD / 2 else "Low"
+    return "Low"
 
 
 def adjust_priority_by_history(dispute_type, priority, history):
@@ -131,9 +662,191 @@ def get_next_steps(dispute_type, priority, customer_history=None):
         return "Answer customer's question using knowledge base. Escalate only if necessary."
 
 
+PRIORITIES = ("Low", "Medium", "High")
+HISTORY_FIELDS = ("previous_disputes", "valid_disputes_pct", "account_age_days", "recent_disputes_30d", "lifetime_value")
+BATCH_CHUNK_SIZE = 256
+# Rate limits count requests, not disputes, so one /disputes/batch call must
+# not be able to carry an unbounded amount of model work.
+MAX_BATCH_DISPUTES = int(os.environ.get("MAX_BATCH_DISPUTES", 10000))
+
+
+def assign_priorities(categories, amounts, histories):
+    # Column-wise version of base_priority and adjust_priority_by_history;
+    # must stay rule-for-rule identical (test_customerDisputeAPI.py checks it).
+    # Priorities are indexes into PRIORITIES.
+    categories = np.asarray(categories)
+    amounts = np.asarray(amounts, dtype=np.float64)
+    fraud = categories == "Fraud"
+    billing = categories == "Billing Error"
+    service = categories == "Service Issue"
+
+    priority = np.select(
+        [fraud | (amounts > HIGH_THRESHOLD), billing & (amounts > MEDIUM_THRESHOLD), service & (amounts > MEDIUM_THRESHOLD / 2)],
+        [2, 1, 1],
+        default=0,
+    )
+
+    has_history = np.array([bool(h) for h in histories])
+    if not has_history.any():
+        return priority
+    tier = np.array([str(h.get("tier", "standard")).lower() if h else "standard" for h in histories])
+    columns = {
+        field: np.array([float(h.get(field, 0)) if h else 0.0 for h in histories])
+        for field in HISTORY_FIELDS
+    }
+
+    adjusted = priority.copy()
+    adjusted = np.where(tier == "vip", 2, np.where((tier == "premium") & (adjusted == 0), 1, adjusted))
+    upgrade = (columns["valid_disputes_pct"] > 80) & (columns["previous_disputes"] > 2)
+    adjusted = np.where(upgrade, np.minimum(adjusted + 1, 2), adjusted)
+    adjusted = np.where((columns["recent_disputes_30d"] >= 3) & billing, 2, adjusted)
+    adjusted = np.where((columns["account_age_days"] < 30) & (adjusted == 0), 1, adjusted)
+    adjusted = np.where(columns["lifetime_value"] > 50000, np.minimum(adjusted + 1, 2), adjusted)
+    return np.where(has_history, adjusted, priority)
+
+
+class InvalidDispute:
+    # Stands in for an input row that could not be parsed, so that it still
+    # gets an error result in its own slot.
+    def __init__(self, error):
+        self.error = error
+
+
+def validate_dispute(dispute):
+    # Returns (description, amount, history) or raises ValueError with the
+    # message reported for that row.
+    if isinstance(dispute, InvalidDispute):
+        raise ValueError(dispute.error)
+    if not isinstance(dispute, dict) or not dispute.get("description"):
+        raise ValueError("Missing required field: description")
+    description = dispute["description"]
+    if not isinstance(description, str):
+        raise ValueError("description must be a string")
+    try:
+        amount = float(dispute.get("transaction_amount", 0))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid transaction_amount")
+
+    history = dispute.get("customer_history") or {}
+    if not isinstance(history, dict):
+        raise ValueError("customer_history must be an object")
+    if not isinstance(history.get("tier", "standard"), str):
+        raise ValueError("customer_history.tier must be a string")
+    for field in HISTORY_FIELDS:
+        if field in history:
+            value = history[field]
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"customer_history.{field} must be a number")
+    return description, amount, history
+
+
+def classify_disputes_batch(disputes):
+    # Classifies a list of /dispute payloads with one batched encode, one
+    # matrix product against the category index and column-wise priority
+    # rules. Returns one result (or error) dict per input, in order.
+    results = [None] * len(disputes)
+    rows = []
+    for i, dispute in enumerate(disputes):
+        try:
+            description, amount, history = validate_dispute(dispute)
+        except ValueError as e:
+            results[i] = {"error": str(e)}
+            continue
+        rows.append((i, description, amount, history))
+
+    if not rows:
+        return results
+
+    with metrics.timer("batch_encode"):
+        embeddings = encode_descriptions([description for _, description, _, _ in rows])
+    with metrics.timer("batch_scoring"):
+        index = get_category_index()
+        best = np.argmax(index.scores(embeddings), axis=1)
+        categories = [index.names[b] for b in best]
+    with metrics.timer("batch_priority"):
+        histories = [history for _, _, _, history in rows]
+        priorities = assign_priorities(categories, [amount for _, _, amount, _ in rows], histories)
+
+    processed_at = time.strftime("%Y-%m-%d %H:%M:%S")
+    for (i, _, _, history), category, priority in zip(rows, categories, priorities.tolist()):
+        results[i] = {
+            "dispute_type": category,
+            "priority": PRIORITIES[priority],
+            "recommended_action": get_next_steps(category, PRIORITIES[priority], history),
+            "processed_at": processed_at,
+        }
+    return results
+
+
+def iter_classified(disputes, chunk_size=BATCH_CHUNK_SIZE):
+    chunk = []
+    for dispute in disputes:
+        chunk.append(dispute)
+        if len(chunk) == chunk_size:
+            yield from classify_disputes_batch(chunk)
+            chunk = []
+    if chunk:
+        yield from classify_disputes_batch(chunk)
+
+
+def read_ndjson(lines):
+    for line in lines:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield InvalidDispute(f"Invalid JSON: {e.msg}")
+
+
+def read_dispute_csv(f):
+    # Flat columns: description, transaction_amount, tier and the HISTORY_FIELDS.
+    for row in csv.DictReader(f):
+        history = {}
+        if row.get("tier"):
+            history["tier"] = row["tier"]
+        try:
+            for field in HISTORY_FIELDS:
+                if row.get(field):
+                    history[field] = float(row[field])
+        except ValueError:
+            yield InvalidDispute(f"{field} must be a number")
+            continue
+        yield {
+            "description": row.get("description"),
+            "transaction_amount": row.get("transaction_amount") or 0,
+            "customer_history": history,
+        }
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "model": MODEL_NAME})
+    # 503 until the model is loaded, so it can double as a readiness probe.
+    # In lazy mode the first /dispute request triggers the load, so the
+    # service has to report ready before that or it would never get one.
+    if model_ready.is_set():
+        status = "healthy"
+    elif model_load_error is not None:
+        status = "error"
+    elif MODEL_LOADING == "lazy":
+        status = "loading" if model_load_lock.locked() else "not_loaded"
+    else:
+        status = "loading"
+    ready = status == "healthy" or (MODEL_LOADING == "lazy" and status != "error")
+    return jsonify({
+        "status": status,
+        "ready": ready,
+        "model_loaded": model_ready.is_set(),
+        "model": MODEL_NAME,
+        "backend": INFERENCE_BACKEND,
+        "load_seconds": model_load_seconds,
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+    }), 200 if ready else 503
 
 
 @app.route('/dispute', methods=['POST'])
@@ -148,15 +861,25 @@ def handle_dispute():
         if not description:
             return jsonify({"error": "Missing required field: description"}), 400
             
-        amount = float(data.get("transaction_amount", 0))
+        try:
+            amount = float(data.get("transaction_amount", 0))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid transaction_amount"}), 400
         customer_history = data.get("customer_history", {})
+        top_k = data.get("top_k", DEFAULT_TOP_K)
+        if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+            return jsonify({"error": "top_k must be a positive integer"}), 400
+        
+        if not wait_until_ready():
+            return not_ready_response()
         
-        dispute_type, priority = classify_dispute(description, amount, customer_history)
+        dispute_type, priority, top_categories = classify_dispute_ranked(description, amount, customer_history, top_k)
         next_steps = get_next_steps(dispute_type, priority, customer_history)
         
         response = {
             "dispute_type": dispute_type,
             "priority": priority,
+            "top_categories": [{"category": c, "score": round(score, 4)} for c, score in top_categories],
             "recommended_action": next_steps,
             "processed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
         }
@@ -168,9 +891,201 @@ def handle_dispute():
         return jsonify({"error": "Internal server error"}), 500
 
 
+SAMPLE_DESCRIPTIONS = [
+    "Someone used my card at a store I have never been to.",
+    "I was charged twice for my monthly subscription.",
+    "The package never arrived even though I paid for express shipping.",
+    "What is this pending charge from yesterday?",
+    "My bill shows a higher amount than the quoted price.",
+    "There is a transaction from another country that I did not make.",
+    "The hotel charged me for a night I cancelled.",
+    "The technician never showed up for the appointment I paid for.",
+]
+
+
+def benchmark(concurrency, requests):
+    # Same workload through the per-request path and through the batcher.
+    descriptions = [f"{SAMPLE_DESCRIPTIONS[i % len(SAMPLE_DESCRIPTIONS)]} Ref {i}." for i in range(requests)]
+
+    def run(encode):
+        latencies = []
+
+        def one(description):
+            start = time.perf_counter()
+            encode(description)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, descriptions))
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        return requests / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+    batcher = encode_batcher or EncodeBatcher(encode_texts)
+    encode_texts(descriptions[:8])  # warm-up
+    for name, encode in (("per-request", lambda d: encode_texts([d])[0]), ("micro-batched", batcher.encode)):
+        throughput, p50, p95 = run(encode)
+        print(f"{name:<14} {throughput:8.1f} req/s   p50 {p50 * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms")
+
+
+@app.route('/disputes/batch', methods=['POST'])
+def handle_disputes_batch():
+    # Accepts a JSON array, or an NDJSON stream (Content-Type: application/x-ndjson)
+    # that is read and classified chunk by chunk. Results stream back as NDJSON,
+    # one line per input dispute, in order. At most MAX_BATCH_DISPUTES per
+    # request: a larger array is rejected with 413, a longer stream ends with
+    # an error line after the first MAX_BATCH_DISPUTES results.
+    if request.mimetype == "application/x-ndjson":
+        disputes = read_ndjson(line.decode("utf-8") for line in request.stream)
+    else:
+        disputes = request.get_json(silent=True)
+        if not isinstance(disputes, list):
+            return jsonify({"error": "Expected a JSON array of disputes"}), 400
+        if len(disputes) > MAX_BATCH_DISPUTES:
+            return jsonify({"error": f"At most {MAX_BATCH_DISPUTES} disputes per batch"}), 413
+    if not wait_until_ready():
+        return not_ready_response()
+    disputes = iter(disputes)
+
+    def generate():
+        try:
+            for result in iter_classified(itertools.islice(disputes, MAX_BATCH_DISPUTES)):
+                yield json.dumps(result) + "\n"
+            if next(disputes, None) is not None:
+                yield json.dumps({"error": f"At most {MAX_BATCH_DISPUTES} disputes per batch; the rest were not classified"}) + "\n"
+        except Exception as e:
+            logger.error(f"Error processing dispute batch: {str(e)}")
+            yield json.dumps({"error": "Internal server error"}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+def classify_file(path, out):
+    count = 0
+    start = time.perf_counter()
+    with open(path, newline="") as f:
+        disputes = read_dispute_csv(f) if path.lower().endswith(".csv") else read_ndjson(f)
+        for result in iter_classified(disputes):
+            out.write(json.dumps(result) + "\n")
+            count += 1
+    elapsed = time.perf_counter() - start
+    logger.info(f"Classified {count} disputes in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f}/s)")
+    return count
+
+
+# Descriptions with known categories, used to check that an alternative
+# inference backend assigns the same categories as the fp32 model.
+LABELED_DISPUTES = [
+    ("Someone used my card at a store I have never been to.", "Fraud"),
+    ("There is a transaction from another country that I did not make.", "Fraud"),
+    ("My wallet was stolen and there are purchases I didn't authorize.", "Fraud"),
+    ("I got an alert for a payment I never approved.", "Fraud"),
+    ("An unknown merchant charged my account three times overnight.", "Fraud"),
+    ("I was charged twice for my monthly subscription.", "Billing Error"),
+    ("My bill shows a higher amount than the quoted price.", "Billing Error"),
+    ("The hotel charged me for a night I cancelled.", "Billing Error"),
+    ("I returned the item but the refund was never credited.", "Billing Error"),
+    ("The restaurant added a tip I didn't agree to.", "Billing Error"),
+    ("The package never arrived even though I paid for express shipping.", "Service Issue"),
+    ("The technician never showed up for the appointment I paid for.", "Service Issue"),
+    ("The laptop I received was broken and the seller ignores me.", "Service Issue"),
+    ("The airline cancelled my flight and offered no alternative.", "Service Issue"),
+    ("The gym closed permanently but I paid for the full year.", "Service Issue"),
+    ("What is this pending charge from yesterday?", "General Inquiry"),
+    ("How do I download my statement for last month?", "General Inquiry"),
+    ("Can you tell me when my dispute will be resolved?", "General Inquiry"),
+    ("What does the reference code on this transaction mean?", "General Inquiry"),
+    ("How long does it take for a refund to show up?", "General Inquiry"),
+]
+
+
+def check_backend(backend, runs=50):
+    # Category agreement with the fp32 model, time-to-ready and encode latency.
+    global CATEGORY_CACHE_DIR
+    import tempfile
+
+    texts = [text for text, _ in LABELED_DISPUTES]
+    labels = [label for _, label in LABELED_DISPUTES]
+    configured_cache_dir = CATEGORY_CACHE_DIR
+    results = {}
+    try:
+        for name in dict.fromkeys(["torch", backend]):
+            CATEGORY_CACHE_DIR = tempfile.mkdtemp()
+            start = time.perf_counter()
+            # In-process, so load time and the fp32 reference are the model's own.
+            encoder = load_model(name, use_service=False)
+            load_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            index = CategoryIndex(DISPUTE_CATEGORIES, CATEGORY_AGGREGATION, encoder, name)
+            index_cold = time.perf_counter() - start
+            start = time.perf_counter()
+            CategoryIndex(DISPUTE_CATEGORIES, CATEGORY_AGGREGATION, encoder, name)
+            index_warm = time.perf_counter() - start
+
+            embeddings = encoder.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+            predictions = [index.names[i] for i in np.argmax(index.scores(embeddings), axis=1)]
+
+            single = []
+            for i in range(runs):
+                start = time.perf_counter()
+                encoder.encode(texts[i % len(texts)], normalize_embeddings=True, convert_to_numpy=True)
+                single.append(time.perf_counter() - start)
+            batch = (texts * 2)[:32]
+            start = time.perf_counter()
+            for _ in range(max(1, runs // 10)):
+                encoder.encode(batch, batch_size=len(batch), normalize_embeddings=True, convert_to_numpy=True)
+            per_item = (time.perf_counter() - start) / (max(1, runs // 10) * len(batch))
+
+            single.sort()
+            results[name] = predictions
+            accuracy = sum(p == l for p, l in zip(predictions, labels)) / len(labels)
+            print(f"{name:<6} load {load_seconds:6.2f}s  categories cold {index_cold * 1000:7.1f}ms / cached {index_warm * 1000:5.1f}ms  "
+                  f"encode p50 {single[len(single) // 2] * 1000:6.2f}ms  batched {per_item * 1000:6.2f}ms/item  "
+                  f"accuracy {accuracy:.0%}")
+    finally:
+        CATEGORY_CACHE_DIR = configured_cache_dir
+
+    agreement = sum(a == b for a, b in zip(results["torch"], results[backend])) / len(texts)
+    mismatches = [(t, a, b) for t, a, b in zip(texts, results["torch"], results[backend]) if a != b]
+    print(f"{backend} assigns the same category as fp32 on {agreement:.0%} of {len(texts)} labeled disputes")
+    for text, expected, got in mismatches:
+        print(f"  {text!r}: fp32 {expected}, {backend} {got}")
+    return agreement
+
+
 if __name__ == '__main__':
-    port = int(os.environ.get("PORT", 5000))
-    debug = os.environ.get("DEBUG", "False").lower() == "true"
-    
-    logger.info(f"Starting dispute classification service on port {port}")
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    parser = argparse.ArgumentParser(description="Dispute classification service")
+    subparsers = parser.add_subparsers(dest="command")
+    bench_parser = subparsers.add_parser("benchmark", help="Compare per-request and micro-batched encoding under concurrent load")
+    bench_parser.add_argument("--concurrency", type=int, default=32)
+    bench_parser.add_argument("--requests", type=int, default=2000)
+    classify_parser = subparsers.add_parser("classify", help="Classify a CSV or JSONL file of disputes to NDJSON")
+    classify_parser.add_argument("input", help="CSV (description, transaction_amount, history columns) or JSONL of /dispute payloads")
+    classify_parser.add_argument("-o", "--output", help="Output NDJSON path (defaults to stdout)")
+    backend_parser = subparsers.add_parser("check-backend", help="Compare an inference backend against the fp32 model")
+    backend_parser.add_argument("--backend", choices=["torch", "int8", "onnx"], default="int8")
+    args = parser.parse_args()
+
+    if args.command in ("benchmark", "classify"):
+        initialize()
+        if not model_ready.is_set():
+            sys.exit(f"Model failed to load: {model_load_error}")
+
+    if args.command == "benchmark":
+        benchmark(args.concurrency, args.requests)
+    elif args.command == "check-backend":
+        check_backend(args.backend)
+    elif args.command == "classify":
+        if args.output:
+            with open(args.output, "w") as out:
+                classify_file(args.input, out)
+        else:
+            classify_file(args.input, sys.stdout)
+    else:
+        start_model_loading()
+        port = int(os.environ.get("PORT", 5000))
+        debug = os.environ.get("DEBUG", "False").lower() == "true"
+
+        logger.info(f"Starting dispute classification service on port {port}")
+        app.run(host='0.0.0.0', port=port, debug=debug)
@@ -1,4 +1,5 @@
 import os
+import sys
 import shutil
 import uvicorn
 import time
@@ -8,19 +9,40 @@ from typing import List, Dict, Any, Optional
 from collections import Counter, defaultdict
 from dotenv import load_dotenv
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from langchain_chroma import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader, CSVLoader, TextLoader
-from langchain_huggingface import HuggingFaceEmbeddings
 from google import genai
 from fastapi.middleware.cors import CORSMiddleware
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rateLimitMiddleware import ASGIRateLimitMiddleware, RateLimitPolicy
+import embeddingService
+from instrumentation import Metrics, PROMETHEUS_CONTENT_TYPE
+
 # Load environment variables
 load_dotenv()
 GOOGLE_API_KEY = os.environ["GEMINI_API_KEY"]
+# Optional Gemini endpoint override, e.g. the local stub used by benchmarkSuite.py.
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL")
 
 app = FastAPI()
+metrics = Metrics("documentSearch")
+
+# Per-route limits; override with a JSON file via RATE_LIMIT_CONFIG.
+# /query/ triggers a Gemini call and /upload/ re-embeds a whole document.
+RATE_LIMITS = {
+    "key": "ip",
+    "routes": {
+        "/query/": {"max_requests": 20, "time_window": 60},
+        "/upload/": {"max_requests": 10, "time_window": 60},
+    },
+}
+
+# Added before CORS so that 429 responses still carry CORS headers.
+app.add_middleware(ASGIRateLimitMiddleware, policy=RateLimitPolicy.from_env(RATE_LIMITS, asynchronous=True))
 
 app.add_middleware(
     CORSMiddleware,
@@ -37,7 +59,15 @@ ANALYTICS_PATH = "./analytics"
 os.makedirs(VECTOR_DB_PATH, exist_ok=True)
 os.makedirs(ANALYTICS_PATH, exist_ok=True)
 
-embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+def local_embeddings():
+    # Imported on demand: sentence-transformers pulls in torch.
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+
+# Prefer the host's shared embedding service (one model copy for all workers);
+# load the model in-process when it isn't running.
+embeddings = embeddingService.connect("all-MiniLM-L6-v2") or local_embeddings()
 vector_db = Chroma(persist_directory=VECTOR_DB_PATH, embedding_function=embeddings)
 
 # Data models
@@ -52,6 +82,7 @@ class QueryRecord(BaseModel):
     response_time: float
     sources: List[str]
     success: bool
+    stage_times: Dict[str, float] = {}
 
 class QueryStats(BaseModel):
     total_queries: int
@@ -121,7 +152,8 @@ async def upload_file(file: UploadFile = File(...)):
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
-        process_and_store(file_path)
+        with metrics.timer("upload_processing"):
+            process_and_store(file_path)
     finally:
         if os.path.exists(file_path):
             os.remove(file_path)
@@ -136,13 +168,16 @@ async def query_knowledge(request: QueryRequest):
     success = False
     response_text = ""
     sources = []
+    stage_times = {}
     
     try:
         if not request.query:
             raise HTTPException(status_code=400, detail="Query cannot be empty")
         
         # Retrieve relevant documents from ChromaDB
-        results = vector_db.similarity_search(request.query, k=5)
+        with metrics.timer("query_retrieval") as retrieval:
+            results = vector_db.similarity_search(request.query, k=5)
+        stage_times["retrieval"] = retrieval.elapsed
         
         # Extract source information and create context
         context_parts = []
@@ -158,17 +193,19 @@ async def query_knowledge(request: QueryRequest):
         sources_citation = ", ".join([f"'{s}'" for s in sources])
         
         # Send query to Google Gemini with instruction to include citations
-        client = genai.Client(api_key=GOOGLE_API_KEY)
+        client = genai.Client(api_key=GOOGLE_API_KEY, http_options={"base_url": GEMINI_BASE_URL} if GEMINI_BASE_URL else None)
         prompt = f"""Based on the following information, answer the question: {request.query}
 
 Context:
 {context}
 """
 
-        gemini_response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
-        )
+        with metrics.timer("query_llm") as llm:
+            gemini_response = client.models.generate_content(
+                model="gemini-2.0-flash",
+                contents=prompt
+            )
+        stage_times["llm"] = llm.elapsed
         
         response_text = gemini_response.text
         success = True
@@ -181,6 +218,7 @@ Context:
         # Calculate response time
         end_time = time.time()
         response_time = end_time - start_time
+        metrics.observe("query_total", response_time)
         
         # Record the query
         record = QueryRecord(
@@ -190,16 +228,19 @@ Context:
             response=response_text,
             response_time=response_time,
             sources=sources,
-            success=success
+            success=success,
+            stage_times=stage_times
         )
         query_records.append(record)
-        save_analytics()
+        with metrics.timer("analytics_save"):
+            save_analytics()
         
         return {
             "query_id": query_id,
             "response": response_text,
             "sources": sources,
-            "response_time": response_time
+            "response_time": response_time,
+            "stage_times": stage_times
         }
 
 @app.get("/analytics/queries")
@@ -309,5 +350,10 @@ async def get_performance_metrics(days: int = 7):
     
     return sorted(result, key=lambda x: x["date"], reverse=True)
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for per-stage latencies"""
+    return PlainTextResponse(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -18,6 +18,17 @@ TEST_QUERIES = [
     "What file formats are supported?"
 ]
 
+def expect_fields(response, *fields):
+    """Marks the request failed unless it returned 200 with the given JSON fields."""
+    if response.status_code != 200:
+        response.failure(f"HTTP {response.status_code}: {response.text[:200]}")
+        return False
+    missing = [field for field in fields if field not in response.json()]
+    if missing:
+        response.failure(f"Missing fields: {missing}")
+        return False
+    return True
+
 class APILoadTestUser(HttpUser):
     wait_time = between(1, 3)  # Wait between 1-3 seconds between tasks
     
@@ -38,38 +49,45 @@ class APILoadTestUser(HttpUser):
     def upload_document(self):
         """Test file upload endpoint"""
         with open(self.sample_file_path, "rb") as f:
-            self.client.post(
+            with self.client.post(
                 "/upload/",
-                files={"file": (os.path.basename(self.sample_file_path), f, "text/plain")}
-            )
+                files={"file": (os.path.basename(self.sample_file_path), f, "text/plain")},
+                catch_response=True
+            ) as response:
+                expect_fields(response, "message")
     
     @task(5)
     def query_knowledge(self):
         """Test query endpoint with random queries"""
         query = random.choice(TEST_QUERIES)
         payload = {"query": query}
-        self.client.post(
-            "/query/",
-            json=payload
-        )
+        with self.client.post("/query/", json=payload, catch_response=True) as response:
+            # Failed queries still return 200, with the error in the response text.
+            if expect_fields(response, "response", "sources") and response.json()["response"].startswith("Error processing query"):
+                response.failure(response.json()["response"][:200])
     
     @task(2)
     def get_query_history(self):
         """Test query history endpoint with random pagination"""
         limit = random.choice([10, 20, 50])
         offset = random.choice([0, 10, 20])
-        self.client.get(f"/analytics/queries?limit={limit}&offset={offset}")
+        with self.client.get(f"/analytics/queries?limit={limit}&offset={offset}", name="/analytics/queries",
+                             catch_response=True) as response:
+            expect_fields(response, "total", "records")
     
     @task(1)
     def get_query_stats(self):
         """Test query stats endpoint"""
-        self.client.get("/analytics/stats")
+        with self.client.get("/analytics/stats", catch_response=True) as response:
+            expect_fields(response)
     
     @task(1)
     def get_performance_metrics(self):
         """Test performance metrics endpoint with random day range"""
         days = random.choice([1, 3, 7, 14, 30])
-        self.client.get(f"/analytics/performance?days={days}")
+        with self.client.get(f"/analytics/performance?days={days}", name="/analytics/performance",
+                             catch_response=True) as response:
+            expect_fields(response)
 
 
 # Configuration for running the load test
@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# One process holds the sentence-transformer model and serves embeddings over
+# a Unix socket, so every worker of documentSearch and customerDisputeAPI on a
+# host shares a single copy of the model instead of loading its own. Requests
+# from all clients are merged into one model.encode batch.
+#
+# Wire format, both directions: 4-byte big-endian length + JSON header.
+#   {"op": "info"}                -> {"ok": true, "model": ..., "dim": ...}
+#   {"op": "encode", "texts": []} -> {"ok": true, "shape": [n, dim]} followed by
+#                                    n * dim float32 values (little-endian)
+#   errors                        -> {"ok": false, "error": "..."}
+#
+# Run it with: python embeddingService.py --model all-MiniLM-L6-v2
+
+EMBEDDING_SOCKET = os.environ.get("EMBEDDING_SOCKET", "/tmp/embedding-service.sock")
+EMBEDDING_SERVICE = os.environ.get("EMBEDDING_SERVICE", "auto").lower()  # auto | off
+
+logger = logging.getLogger('embedding-service')
+
+_LENGTH = struct.Struct(">I")
+
+
+class EmbeddingServiceUnavailable(Exception):
+    pass
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding service closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class EmbeddingClient:
+    # Drop-in for the parts of SentenceTransformer (encode,
+    # get_sentence_embedding_dimension) and LangChain Embeddings
+    # (embed_documents, embed_query) that the services use. If the service
+    # goes away after start-up (e.g. while it restarts), calls are served by
+    # an in-process model while the service is retried with exponential
+    # backoff; once it answers again the local model is dropped.
+    RETRY_MIN = 0.5
+    RETRY_MAX = 30.0
+
+    def __init__(self, model_name, socket_path=EMBEDDING_SOCKET, timeout=30.0):
+        self.model_name = model_name
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+        self._retry_at = 0.0
+        self._backoff = self.RETRY_MIN
+
+        try:
+            info, _ = self._request({"op": "info"})
+        except OSError as e:
+            raise EmbeddingServiceUnavailable(f"No embedding service at {socket_path}: {e}") from e
+        if info["model"] != model_name:
+            raise EmbeddingServiceUnavailable(f"Embedding service at {socket_path} serves {info['model']}, not {model_name}")
+        self.dim = info["dim"]
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _request(self, message):
+        sock = self._connection()
+        try:
+            payload = json.dumps(message).encode()
+            sock.sendall(_LENGTH.pack(len(payload)) + payload)
+            header = json.loads(_recv_exact(sock, _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))[0]))
+            if not header.get("ok"):
+                raise RuntimeError(f"Embedding service error: {header.get('error')}")
+            body = None
+            if "shape" in header:
+                rows, dim = header["shape"]
+                body = np.frombuffer(_recv_exact(sock, rows * dim * 4), dtype="<f4").reshape(rows, dim)
+            return header, body
+        except OSError:
+            sock.close()
+            self._local.sock = None
+            raise
+
+    def _fallback_model(self):
+        with self._fallback_lock:
+            if self._fallback is None:
+                from sentence_transformers import SentenceTransformer
+
+                logger.warning(f"Embedding service unavailable, loading {self.model_name} in-process until it is back")
+                self._fallback = SentenceTransformer(self.model_name)
+            return self._fallback
+
+    def _encode_remote(self, texts):
+        # Returns None if the service is unreachable (or still backing off).
+        if time.monotonic() < self._retry_at:
+            return None
+        error = None
+        for _ in range(2):  # the second attempt uses a fresh connection, e.g. after a service restart
+            try:
+                _, embeddings = self._request({"op": "encode", "texts": texts})
+            except OSError as e:
+                error = e
+                continue
+            if self._backoff != self.RETRY_MIN or self._fallback is not None:
+                with self._fallback_lock:
+                    if self._fallback is not None:
+                        logger.info("Embedding service is back, releasing the in-process model")
+                    self._fallback = None
+                    self._backoff = self.RETRY_MIN
+            return embeddings
+
+        with self._fallback_lock:
+            logger.warning(f"Embedding service request failed ({error}), retrying in {self._backoff:.1f}s")
+            self._retry_at = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, self.RETRY_MAX)
+        return None
+
+    def encode(self, sentences, batch_size=None, normalize_embeddings=False, convert_to_numpy=True, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        embeddings = self._encode_remote(texts)
+        if embeddings is None:
+            embeddings = self._fallback_model().encode(texts, convert_to_numpy=True).astype(np.float32)
+
+        if normalize_embeddings:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    # LangChain Embeddings interface, matching HuggingFaceEmbeddings' defaults.
+    def embed_documents(self, texts):
+        return self.encode([text.replace("\n", " ") for text in texts]).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def connect(model_name, socket_path=EMBEDDING_SOCKET):
+    # Returns a client for a running embedding service, or None so the caller
+    # can load the model in-process as before.
+    if EMBEDDING_SERVICE == "off" or not os.path.exists(socket_path):
+        return None
+    try:
+        client = EmbeddingClient(model_name, socket_path)
+    except EmbeddingServiceUnavailable as e:
+        logger.warning(str(e))
+        return None
+    logger.info(f"Using shared embedding service at {socket_path}")
+    return client
+
+
+async def serve(model_name, socket_path, max_batch_size, max_wait, model=None):
+    # model: anything with encode() and get_sentence_embedding_dimension(),
+    # e.g. a stand-in for benchmarks; defaults to the real SentenceTransformer.
+    if model is None:
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(model_name)
+    dim = model.get_sentence_embedding_dimension()
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Queue()
+    # Encoding runs off the event loop so that new requests keep queueing
+    # (and join the next batch) while the current one is on the CPU.
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def encode(texts):
+        return model.encode(texts, batch_size=max_batch_size, convert_to_numpy=True).astype("<f4")
+
+    async def encode_async(texts):
+        if not texts:
+            return np.zeros((0, dim), "<f4")
+        return await loop.run_in_executor(executor, encode, texts)
+
+    async def batcher():
+        while True:
+            batch = [await pending.get()]
+            count = len(batch[0][0])
+            deadline = loop.time() + max_wait
+            while count < max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(pending.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                count += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                embeddings = await encode_async(texts)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                # Retry request by request so one client's bad input only fails its own request.
+                for item_texts, future in batch:
+                    try:
+                        future.set_result(await encode_async(item_texts))
+                    except Exception as item_error:
+                        future.set_exception(item_error)
+                continue
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    async def respond(writer, header, body=b""):
+        payload = json.dumps(header).encode()
+        writer.write(_LENGTH.pack(len(payload)) + payload + body)
+        await writer.drain()
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    length = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))[0]
+                    message = json.loads(await reader.readexactly(length))
+                except asyncio.IncompleteReadError:
+                    break
+
+                op = message.get("op") if isinstance(message, dict) else None
+                if op == "info":
+                    await respond(writer, {"ok": True, "model": model_name, "dim": dim})
+                elif op == "encode":
+                    texts = message.get("texts")
+                    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                        await respond(writer, {"ok": False, "error": "texts must be a list of strings"})
+                        continue
+                    future = loop.create_future()
+                    pending.put_nowait((texts, future))
+                    try:
+                        embeddings = await future
+                    except Exception as e:
+                        await respond(writer, {"ok": False, "error": str(e)})
+                        continue
+                    await respond(writer, {"ok": True, "shape": list(embeddings.shape)}, embeddings.tobytes())
+                else:
+                    await respond(writer, {"ok": False, "error": "Unknown request"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    os.chmod(socket_path, 0o660)
+    logger.info(f"Serving {model_name} embeddings on {socket_path}")
+    batch_task = asyncio.create_task(batcher())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Shared local sentence-embedding service")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--socket", default=EMBEDDING_SOCKET)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.model, args.socket, args.max_batch_size, args.max_wait_ms / 1000))
@@ -1,14 +1,34 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import List
+import numpy as np
 import uvicorn
 import asyncpg
+import argparse
+import json
+import csv
+import sys
+import time
 import os
 
+from instrumentation import Metrics, PROMETHEUS_CONTENT_TYPE
+
 
 app = FastAPI()
+metrics = Metrics("customerPortal")
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "")
 
-SUPABASE_URL = ""
-SUPABASE_KEY = ""
+BATCH_CHUNK_SIZE = 10000
+
+ELIGIBILITY_SCORES = (90, 70, 40)
+ELIGIBILITY_RECOMMENDATIONS = (
+    "Excellent eligibility! High chances of approval.",
+    "Moderate eligibility, manual review is required. Consider reducing loan amount for high eligibility.",
+    "Low eligibility. Improve credit score or income.",
+)
 
 class LoanRequest(BaseModel):
     income: float
@@ -18,38 +38,185 @@ class LoanRequest(BaseModel):
 async def connect_db():
     return await asyncpg.connect(SUPABASE_URL, password=SUPABASE_KEY)
 
-@app.post("/check_eligibility")
-def check_eligibility(income, credit_score, loan_amount):
+def eligibility_tier(income, credit_score, loan_amount):
     if income > 50000 and credit_score > 750 and loan_amount < (income * 5):
-        return {"score": 90, "recommendation": "Excellent eligibility! High chances of approval."}
+        return 0
     elif income > 30000 and credit_score > 600 and loan_amount < (income * 7):
-        return {"score": 70, "recommendation": "Moderate eligibility, manual review is required. Consider reducing loan amount for high eligibility."}
+        return 1
     else:
-        return {"score": 40, "recommendation": "Low eligibility. Improve credit score or income."}
+        return 2
+
+def eligibility_tiers(income, credit_score, loan_amount):
+    # Column-wise version of eligibility_tier; must stay rule-for-rule identical.
+    income = np.asarray(income, dtype=np.float64)
+    credit_score = np.asarray(credit_score, dtype=np.int64)
+    loan_amount = np.asarray(loan_amount, dtype=np.float64)
+
+    excellent = (income > 50000) & (credit_score > 750) & (loan_amount < income * 5)
+    moderate = (income > 30000) & (credit_score > 600) & (loan_amount < income * 7)
+    return np.select([excellent, moderate], [0, 1], default=2).astype(np.int8)
+
+def eligibility_result(tier):
+    return {"score": ELIGIBILITY_SCORES[tier], "recommendation": ELIGIBILITY_RECOMMENDATIONS[tier]}
+
+def iter_eligibility_results(income, credit_score, loan_amount, chunk_size=BATCH_CHUNK_SIZE):
+    scores = np.array(ELIGIBILITY_SCORES, dtype=np.int64)
+    for start in range(0, len(income), chunk_size):
+        end = start + chunk_size
+        tiers = eligibility_tiers(income[start:end], credit_score[start:end], loan_amount[start:end])
+        yield scores[tiers], tiers
+
+@app.post("/check_eligibility")
+def check_eligibility(income: float, credit_score: int, loan_amount: float):
+    return eligibility_result(eligibility_tier(income, credit_score, loan_amount))
+
+@app.post("/check_eligibility/batch")
+def check_eligibility_batch(requests: List[LoanRequest]):
+    started = time.perf_counter()
+    income = np.fromiter((r.income for r in requests), dtype=np.float64, count=len(requests))
+    credit_score = np.fromiter((r.credit_score for r in requests), dtype=np.int64, count=len(requests))
+    loan_amount = np.fromiter((r.loan_amount for r in requests), dtype=np.float64, count=len(requests))
+
+    def stream():
+        for scores, tiers in iter_eligibility_results(income, credit_score, loan_amount):
+            lines = [
+                json.dumps({"score": int(score), "recommendation": ELIGIBILITY_RECOMMENDATIONS[tier]})
+                for score, tier in zip(scores.tolist(), tiers.tolist())
+            ]
+            yield "\n".join(lines) + "\n"
+        metrics.observe("eligibility_batch", time.perf_counter() - started)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 @app.get("/get_balance/{user_id}")
 async def get_balance(user_id: int):
-    conn = await connect_db()
+    with metrics.timer("db_connect"):
+        conn = await connect_db()
     query = "SELECT account_balance FROM users WHERE user_id = $1"
-    result = await conn.fetchval(query, user_id)
+    with metrics.timer("db_query"):
+        result = await conn.fetchval(query, user_id)
     await conn.close()
 
     if result is None:
         raise HTTPException(status_code=404, detail="User not found")
-    
+
     return {"user_id": user_id, "account_balance": result}
 
 @app.get("/get_dispute_history/{user_id}")
 async def get_dispute_history(user_id: int):
-    conn = await connect_db()
+    with metrics.timer("db_connect"):
+        conn = await connect_db()
     query = "SELECT dispute_history FROM users WHERE user_id = $1"
-    result = await conn.fetchval(query, user_id)
+    with metrics.timer("db_query"):
+        result = await conn.fetchval(query, user_id)
     await conn.close()
 
     if result is None:
         raise HTTPException(status_code=404, detail="User not found")
-    
+
     return {"user_id": user_id, "dispute_history": result}
 
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+def read_applicant_chunks(path, chunk_size=BATCH_CHUNK_SIZE):
+    if path.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size,
+                                                        columns=["income", "credit_score", "loan_amount"]):
+            columns = batch.to_pydict()
+            yield columns["income"], columns["credit_score"], columns["loan_amount"]
+        return
+
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        rows = []
+        for row in reader:
+            rows.append((reader.line_num, row))
+            if len(rows) == chunk_size:
+                yield _csv_columns(rows)
+                rows = []
+        if rows:
+            yield _csv_columns(rows)
+
+def _csv_columns(rows):
+    income, credit_score, loan_amount = [], [], []
+    for line, row in rows:
+        try:
+            # Spreadsheet exports often write whole numbers as "720.0".
+            score = float(row["credit_score"])
+            if not score.is_integer():
+                raise ValueError(f"credit_score must be a whole number, got {row['credit_score']!r}")
+            income.append(float(row["income"]))
+            credit_score.append(int(score))
+            loan_amount.append(float(row["loan_amount"]))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"line {line}: {e}") from None
+    return income, credit_score, loan_amount
+
+def score_file(path, out):
+    writer = csv.writer(out)
+    writer.writerow(["income", "credit_score", "loan_amount", "score", "recommendation"])
+    total = 0
+    for income, credit_score, loan_amount in read_applicant_chunks(path):
+        tiers = eligibility_tiers(income, credit_score, loan_amount).tolist()
+        writer.writerows(
+            (inc, cs, amt, ELIGIBILITY_SCORES[t], ELIGIBILITY_RECOMMENDATIONS[t])
+            for inc, cs, amt, t in zip(income, credit_score, loan_amount, tiers)
+        )
+        total += len(tiers)
+    return total
+
+def benchmark(n, seed=0):
+    rng = np.random.default_rng(seed)
+    income = rng.uniform(0, 150000, n).round(2)
+    credit_score = rng.integers(300, 851, n)
+    loan_amount = rng.uniform(0, 1000000, n).round(2)
+
+    start = time.perf_counter()
+    scalar = [
+        eligibility_result(eligibility_tier(inc, cs, amt))
+        for inc, cs, amt in zip(income.tolist(), credit_score.tolist(), loan_amount.tolist())
+    ]
+    scalar_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = [(scores, tiers) for scores, tiers in iter_eligibility_results(income, credit_score, loan_amount)]
+    vectorized_elapsed = time.perf_counter() - start
+
+    scores = np.concatenate([s for s, _ in vectorized])
+    tiers = np.concatenate([t for _, t in vectorized])
+    for i, expected in enumerate(scalar):
+        if expected != {"score": int(scores[i]), "recommendation": ELIGIBILITY_RECOMMENDATIONS[tiers[i]]}:
+            raise AssertionError(f"Mismatch at row {i}: {expected} vs score={scores[i]}")
+
+    print(f"Scored {n} applicants, results identical")
+    print(f"per-request: {n / scalar_elapsed:,.0f} applicants/sec ({scalar_elapsed:.3f}s)")
+    print(f"vectorized:  {n / vectorized_elapsed:,.0f} applicants/sec ({vectorized_elapsed:.3f}s)")
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    parser = argparse.ArgumentParser(description="Customer portal API and offline loan-eligibility scoring")
+    subparsers = parser.add_subparsers(dest="command")
+    score_parser = subparsers.add_parser("score", help="Score a CSV/Parquet file of loan requests")
+    score_parser.add_argument("input", help="CSV or Parquet file with income, credit_score, loan_amount columns")
+    score_parser.add_argument("-o", "--output", help="Output CSV path (defaults to stdout)")
+    bench_parser = subparsers.add_parser("benchmark", help="Compare per-request and vectorized scoring")
+    bench_parser.add_argument("-n", type=int, default=1000000, help="Number of synthetic applicants")
+    args = parser.parse_args()
+
+    if args.command == "score":
+        try:
+            if args.output:
+                with open(args.output, "w", newline="") as out:
+                    count = score_file(args.input, out)
+            else:
+                count = score_file(args.input, sys.stdout)
+        except ValueError as e:
+            sys.exit(f"Cannot score {args.input}: {e}")
+        print(f"Scored {count} applicants", file=sys.stderr)
+    elif args.command == "benchmark":
+        benchmark(args.n)
+    else:
+        uvicorn.run(app, host="127.0.0.1", port=8000)
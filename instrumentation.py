@@ -0,0 +1,181 @@
+import bisect
+import itertools
+import threading
+import time
+
+# Per-stage latency instrumentation shared by all services.
+#
+#   metrics = Metrics("banking")
+#   with metrics.timer("debit_lock_wait"):
+#       ...
+#
+# Each stage keeps an HDR-style histogram: exact to the microsecond below
+# 64us, then every power of two is split into 32 linear sub-buckets, so any
+# recorded latency is within ~3% and memory stays fixed at ~1.2k counters per
+# stage however many observations arrive. The Prometheus buckets are counted
+# separately and exactly, so le="0.005" really is every observation <= 5ms
+# rather than whatever shares a sub-bucket with the boundary. A record is two
+# perf_counter() calls, two index computations and one locked update, cheap
+# enough to leave on in production. metrics.render() produces the Prometheus text format
+# served on each service's /metrics.
+
+PROMETHEUS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    SUB_BITS = 6
+    MAX_EXPONENT = 36  # values are capped at ~2**42us (~50 days)
+
+    def __init__(self):
+        half = 1 << (self.SUB_BITS - 1)
+        self.counts = [0] * (self.MAX_EXPONENT * half + (1 << self.SUB_BITS))
+        self.le_counts = [0] * (len(PROMETHEUS_BUCKETS) + 1)  # last slot: above every boundary
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def _index(cls, micros):
+        if micros < (1 << cls.SUB_BITS):
+            return micros
+        exponent = min(micros.bit_length() - cls.SUB_BITS, cls.MAX_EXPONENT)
+        mantissa = min(micros >> exponent, (1 << cls.SUB_BITS) - 1)
+        return (exponent << (cls.SUB_BITS - 1)) + mantissa
+
+    @classmethod
+    def _bounds(cls, index):
+        # [lower, upper) in microseconds of the values counted in a bucket.
+        if index < (1 << cls.SUB_BITS):
+            return index, index + 1
+        exponent = (index >> (cls.SUB_BITS - 1)) - 1
+        mantissa = index - (exponent << (cls.SUB_BITS - 1))
+        return mantissa << exponent, (mantissa + 1) << exponent
+
+    def record(self, seconds):
+        index = self._index(max(0, int(seconds * 1e6)))
+        le_index = bisect.bisect_left(PROMETHEUS_BUCKETS, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.le_counts[le_index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantile(self, q):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        for index, cumulative in enumerate(itertools.accumulate(counts)):
+            if cumulative >= rank and counts[index]:
+                lower, upper = self._bounds(index)
+                return (lower + upper) / 2 / 1e6
+        return self.max
+
+    def snapshot(self):
+        # Cumulative count of values <= each of PROMETHEUS_BUCKETS, count, sum.
+        with self.lock:
+            return list(itertools.accumulate(self.le_counts[:-1])), self.count, self.sum
+
+
+class StageTimer:
+    __slots__ = ("metrics", "stage", "start", "elapsed")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.elapsed = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.start
+        self.metrics.observe(self.stage, self.elapsed)
+        return False
+
+
+class Metrics:
+    def __init__(self, service):
+        self.service = service
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram())
+        return histogram
+
+    def observe(self, stage, seconds):
+        self.histogram(stage).record(seconds)
+
+    def timer(self, stage):
+        return StageTimer(self, stage)
+
+    def summary(self):
+        return {
+            stage: {
+                "count": histogram.count,
+                **{f"p{int(q * 100)}": histogram.quantile(q) for q in QUANTILES},
+            }
+            for stage, histogram in sorted(self.histograms.items())
+        }
+
+    def render(self):
+        lines = [
+            "# HELP stage_duration_seconds Latency of instrumented request stages.",
+            "# TYPE stage_duration_seconds histogram",
+        ]
+        quantile_lines = [
+            "# HELP stage_duration_quantile_seconds Latency quantiles of instrumented request stages.",
+            "# TYPE stage_duration_quantile_seconds gauge",
+        ]
+        for stage, histogram in sorted(self.histograms.items()):
+            labels = f'service="{self.service}",stage="{stage}"'
+            le_counts, count, total = histogram.snapshot()
+            for boundary, cumulative in zip(PROMETHEUS_BUCKETS, le_counts):
+                lines.append(f'stage_duration_seconds_bucket{{{labels},le="{boundary}"}} {cumulative}')
+            lines.append(f'stage_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"stage_duration_seconds_sum{{{labels}}} {total}")
+            lines.append(f"stage_duration_seconds_count{{{labels}}} {count}")
+            for q in QUANTILES:
+                quantile_lines.append(f'stage_duration_quantile_seconds{{{labels},quantile="{q}"}} {histogram.quantile(q)}')
+        return "\n".join(lines + quantile_lines) + "\n"
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _benchmark(n=1000000):
+    import random
+
+    metrics = Metrics("benchmark")
+    start = time.perf_counter()
+    for _ in range(n):
+        with metrics.timer("noop"):
+            pass
+    per_timer = (time.perf_counter() - start) / n
+    print(f"timer overhead: {per_timer * 1e6:.2f} us per timed stage")
+
+    histogram = LatencyHistogram()
+    samples = sorted(random.lognormvariate(-4, 1) for _ in range(200000))
+    for sample in samples:
+        histogram.record(sample)
+    for q in QUANTILES:
+        exact = samples[int(q * len(samples)) - 1]
+        print(f"p{int(q * 100)}: exact {exact * 1000:.3f} ms, histogram {histogram.quantile(q) * 1000:.3f} ms")
+    le_counts, _, _ = histogram.snapshot()
+    exact_le = [bisect.bisect_right(samples, boundary) for boundary in PROMETHEUS_BUCKETS]
+    print(f"prometheus buckets exact: {le_counts == exact_le}")
+
+
+if __name__ == "__main__":
+    _benchmark()
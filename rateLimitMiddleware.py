@@ -0,0 +1,226 @@
+import json
+import math
+import os
+import time
+
+from rateLimitor import AsyncRateLimiter, RateLimiter, SharedMemoryStorage
+
+# Config shape (a dict, or a JSON file of the same shape):
+#
+#   {
+#       "key": "ip",                      # or "api_key" / "route"
+#       "api_key_header": "X-API-Key",
+#       "api_keys": ["key-1", "key-2"],   # required for "api_key"
+#       "storage": "memory",              # or "shared" (one limit across worker processes)
+#       "shared_path": "/dev/shm/rate-limits-dispute",  # required for "shared", one per service
+#       "default": {"max_requests": 100, "time_window": 60},
+#       "routes": {
+#           "/query/": {"max_requests": 10, "time_window": 60, "algorithm": "gcra"}
+#       }
+#   }
+#
+# Routes without an entry fall back to "default"; with no default they are not limited.
+# "api_key" gives each key listed in "api_keys" its own bucket. The header is
+# client-supplied, so missing or unlisted keys share the client IP's bucket;
+# otherwise a client could skip the limit by sending a new key per request.
+
+DEFAULT_ALGORITHM = "sliding_window"
+DEFAULT_API_KEY_HEADER = "X-API-Key"
+
+
+class RateLimitPolicy:
+    def __init__(self, config, asynchronous=False):
+        self.key = config.get("key", "ip")
+        if self.key not in ("api_key", "ip", "route"):
+            raise ValueError(f"Unknown rate limit key: {self.key!r}")
+        self.api_key_header = config.get("api_key_header", DEFAULT_API_KEY_HEADER)
+        self.api_keys = frozenset(config.get("api_keys", ()))
+        if self.key == "api_key" and not self.api_keys:
+            raise ValueError('Rate limit key "api_key" needs an "api_keys" allow-list')
+        self.asynchronous = asynchronous
+
+        storage = None
+        if config.get("storage") == "shared":
+            if not config.get("shared_path"):
+                raise ValueError('Rate limit storage "shared" needs a "shared_path"')
+            storage = SharedMemoryStorage(config["shared_path"])
+        limiter_class = AsyncRateLimiter if asynchronous else RateLimiter
+
+        def build(rule):
+            return limiter_class(rule["max_requests"], rule["time_window"], rule.get("algorithm", DEFAULT_ALGORITHM),
+                                 storage=storage)
+
+        self.default = build(config["default"]) if config.get("default") else None
+        self.routes = {path: build(rule) for path, rule in config.get("routes", {}).items()}
+
+    @classmethod
+    def from_file(cls, path, asynchronous=False):
+        with open(path) as f:
+            return cls(json.load(f), asynchronous)
+
+    @classmethod
+    def from_env(cls, default_config, asynchronous=False):
+        # RATE_LIMIT_CONFIG points at a JSON file that replaces the service's built-in limits.
+        path = os.environ.get("RATE_LIMIT_CONFIG")
+        if path:
+            return cls.from_file(path, asynchronous)
+        return cls(default_config, asynchronous)
+
+    def limiter_for(self, path):
+        return self.routes.get(path, self.default)
+
+    def key_for(self, path, api_key, client_ip):
+        if self.key == "route":
+            return path
+        if self.key == "api_key" and api_key in self.api_keys:
+            return f"{path}|key:{api_key}"
+        return f"{path}|ip:{client_ip}"
+
+
+def _headers(limiter, remaining, retry_after, allowed):
+    headers = [
+        ("X-RateLimit-Limit", str(limiter.max_requests)),
+        ("X-RateLimit-Remaining", str(remaining)),
+    ]
+    if not allowed:
+        headers.append(("Retry-After", str(max(1, math.ceil(retry_after)))))
+    return headers
+
+
+_REJECTION_BODY = json.dumps({"error": "Too many requests"}).encode()
+
+
+class ASGIRateLimitMiddleware:
+    # Pure ASGI, so a rejected request is answered before the request body is
+    # read or any route handler (and its model/LLM call) runs.
+    def __init__(self, app, policy):
+        if not policy.asynchronous:
+            raise ValueError("ASGIRateLimitMiddleware needs a RateLimitPolicy built with asynchronous=True")
+        self.app = app
+        self.policy = policy
+        self._api_key_header = policy.api_key_header.lower().encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        path = scope["path"]
+        limiter = self.policy.limiter_for(path)
+        if limiter is None:
+            return await self.app(scope, receive, send)
+
+        api_key = None
+        for name, value in scope["headers"]:
+            if name == self._api_key_header:
+                api_key = value.decode("latin-1")
+                break
+        client = scope.get("client")
+        key = self.policy.key_for(path, api_key, client[0] if client else None)
+
+        allowed, remaining, retry_after = await limiter.check(key)
+        headers = [(k.lower().encode(), v.encode()) for k, v in _headers(limiter, remaining, retry_after, allowed)]
+
+        if not allowed:
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": headers + [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(_REJECTION_BODY)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": _REJECTION_BODY})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class WSGIRateLimitMiddleware:
+    # Wraps a WSGI callable (e.g. Flask's app.wsgi_app); rejected requests
+    # never reach Flask's request parsing.
+    def __init__(self, app, policy):
+        if policy.asynchronous:
+            raise ValueError("WSGIRateLimitMiddleware needs a RateLimitPolicy built with asynchronous=False")
+        self.app = app
+        self.policy = policy
+        self._api_key_environ = "HTTP_" + policy.api_key_header.upper().replace("-", "_")
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        limiter = self.policy.limiter_for(path)
+        if limiter is None:
+            return self.app(environ, start_response)
+
+        key = self.policy.key_for(path, environ.get(self._api_key_environ), environ.get("REMOTE_ADDR"))
+        allowed, remaining, retry_after = limiter.check(key)
+        headers = _headers(limiter, remaining, retry_after, allowed)
+
+        if not allowed:
+            start_response("429 Too Many Requests", headers + [
+                ("Content-Type", "application/json"),
+                ("Content-Length", str(len(_REJECTION_BODY))),
+            ])
+            return [_REJECTION_BODY]
+
+        def start_response_with_headers(status, response_headers, exc_info=None):
+            return start_response(status, list(response_headers) + headers, exc_info)
+
+        return self.app(environ, start_response_with_headers)
+
+
+def _benchmark(requests=100000):
+    import asyncio
+
+    config = {"key": "api_key", "api_keys": [str(i) for i in range(1000)],
+              "default": {"max_requests": 10 ** 9, "time_window": 60}}
+
+    async def asgi_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    def asgi_run(app):
+        async def run():
+            start = time.perf_counter()
+            for i in range(requests):
+                scope = {"type": "http", "path": "/query/", "headers": [(b"x-api-key", str(i % 1000).encode())],
+                         "client": ("127.0.0.1", 1234)}
+                await app(scope, receive, send)
+            return time.perf_counter() - start
+        return asyncio.run(run())
+
+    def wsgi_app(environ, start_response):
+        start_response("200 OK", [])
+        return [b""]
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def wsgi_run(app):
+        start = time.perf_counter()
+        for i in range(requests):
+            app({"PATH_INFO": "/dispute", "HTTP_X_API_KEY": str(i % 1000), "REMOTE_ADDR": "127.0.0.1"}, start_response)
+        return time.perf_counter() - start
+
+    bare = asgi_run(asgi_app)
+    wrapped = asgi_run(ASGIRateLimitMiddleware(asgi_app, RateLimitPolicy(config, asynchronous=True)))
+    print(f"ASGI middleware overhead: {(wrapped - bare) / requests * 1e6:.2f} us/request")
+
+    bare = wsgi_run(wsgi_app)
+    wrapped = wsgi_run(WSGIRateLimitMiddleware(wsgi_app, RateLimitPolicy(config)))
+    print(f"WSGI middleware overhead: {(wrapped - bare) / requests * 1e6:.2f} us/request")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -1,26 +1,816 @@
-from collections import deque
+from array import array
+from collections import OrderedDict
+import argparse
+import asyncio
+import hashlib
+import itertools
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
 import time
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class _LogState:
+    __slots__ = ("last_seen", "start", "timestamps")
+
+    def __init__(self, now):
+        self.last_seen = now
+        self.start = 0
+        self.timestamps = array("d")
+
+    def nbytes(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.timestamps)
+
+
+class _CounterState:
+    __slots__ = ("last_seen", "window", "current", "previous")
+
+    def __init__(self, now, window):
+        self.last_seen = now
+        self.window = window
+        self.current = 0
+        self.previous = 0
+
+    def nbytes(self):
+        return sys.getsizeof(self)
+
+
+class _BucketState:
+    __slots__ = ("last_seen", "tokens")
+
+    def __init__(self, now, tokens):
+        self.last_seen = now
+        self.tokens = tokens
+
+    def nbytes(self):
+        return sys.getsizeof(self)
+
+
+class _GCRAState:
+    __slots__ = ("last_seen", "tat")
+
+    def __init__(self, now):
+        self.last_seen = now
+        self.tat = now
+
+    def nbytes(self):
+        return sys.getsizeof(self)
+
+
+class SlidingWindowLog:
+    # Exact: remembers every admitted timestamp, O(max_requests) memory per user.
+    # Timestamps live in a flat array of doubles; expired ones are skipped by
+    # advancing `start` and compacted away once they make up half the array.
+    STATE_FIELDS = None
+
+    def __init__(self, max_requests, time_window):
+        self.max_requests = max_requests
+        self.time_window = time_window
+
+    def new_state(self, now):
+        return _LogState(now)
+
+    def is_allowed(self, state, now):
+        timestamps = state.timestamps
+        start = state.start
+        end = len(timestamps)
+        while start < end and now - timestamps[start] > self.time_window:
+            start += 1
+
+        if start and start * 2 >= end:
+            del timestamps[:start]
+            start = 0
+        state.start = start
+
+        if len(timestamps) - start < self.max_requests:
+            timestamps.append(now)
+            return True
+        else:
+            return False
+
+    def limit_info(self, state, now):
+        in_window = len(state.timestamps) - state.start
+        if in_window < self.max_requests:
+            return self.max_requests - in_window, 0.0
+        return 0, max(0.0, state.timestamps[state.start] + self.time_window - now)
+
+
+class SlidingWindowCounter:
+    # Weights the previous fixed window's count by how much of it still overlaps
+    # the sliding window.
+    STATE_FIELDS = ("window", "current", "previous")
+
+    def __init__(self, max_requests, time_window):
+        self.max_requests = max_requests
+        self.time_window = time_window
+
+    def new_state(self, now):
+        return _CounterState(now, math.floor(now / self.time_window))
+
+    def is_allowed(self, state, now):
+        window = math.floor(now / self.time_window)
+        if window != state.window:
+            state.previous = state.current if window == state.window + 1 else 0
+            state.current = 0
+            state.window = window
+
+        elapsed_fraction = now / self.time_window - window
+        estimated = state.previous * (1 - elapsed_fraction) + state.current
+        if estimated < self.max_requests:
+            state.current += 1
+            return True
+        else:
+            return False
+
+    def limit_info(self, state, now):
+        elapsed_fraction = now / self.time_window - state.window
+        estimated = state.previous * (1 - elapsed_fraction) + state.current
+        if estimated < self.max_requests:
+            return math.ceil(self.max_requests - estimated), 0.0
+        if state.current >= self.max_requests or not state.previous:
+            return 0, (state.window + 1) * self.time_window - now
+        # Wait until the previous window's weight has decayed enough.
+        fraction = 1 - (self.max_requests - state.current) / state.previous
+        return 0, max(0.0, (state.window + fraction) * self.time_window - now)
+
+
+class TokenBucket:
+    # Bucket of max_requests tokens refilled continuously over time_window.
+    STATE_FIELDS = ("tokens",)
+
+    def __init__(self, max_requests, time_window):
+        self.max_requests = max_requests
+        self.time_window = time_window
+        self.refill_rate = max_requests / time_window
+
+    def new_state(self, now):
+        return _BucketState(now, float(self.max_requests))
+
+    def is_allowed(self, state, now):
+        tokens = min(self.max_requests, state.tokens + (now - state.last_seen) * self.refill_rate)
+        if tokens >= 1:
+            state.tokens = tokens - 1
+            return True
+        else:
+            state.tokens = tokens
+            return False
+
+    def limit_info(self, state, now):
+        tokens = min(self.max_requests, state.tokens + (now - state.last_seen) * self.refill_rate)
+        if tokens >= 1:
+            return math.floor(tokens), 0.0
+        return 0, (1 - tokens) / self.refill_rate
+
+
+class GCRA:
+    # Generic cell rate algorithm: a single "theoretical arrival time" per user.
+    # Admits bursts of up to max_requests, then one request per time_window / max_requests.
+    STATE_FIELDS = ("tat",)
 
-class RateLimiter:
     def __init__(self, max_requests, time_window):
         self.max_requests = max_requests
         self.time_window = time_window
-        self.user_request_history = {}
-    
-    def is_allowed(self, user_id):
-        now = time.time()
-        
-        if user_id not in self.user_request_history:
-            self.user_request_history[user_id] = deque()
-        
-        request_history = self.user_request_history[user_id]
-        
-        while request_history and now - request_history[0] > self.time_window:
-            request_history.popleft()
-        
-        if len(request_history) < self.max_requests:
-            request_history.append(now)
+        self.emission_interval = time_window / max_requests
+
+    def new_state(self, now):
+        return _GCRAState(now)
+
+    def is_allowed(self, state, now):
+        new_tat = max(state.tat, now) + self.emission_interval
+        # Tolerance for the float error accumulated over a burst of emission intervals.
+        if new_tat - now <= self.time_window + self.emission_interval * 1e-6:
+            state.tat = new_tat
             return True
         else:
             return False
+
+    def limit_info(self, state, now):
+        headroom = self.time_window - (max(state.tat, now) - now)
+        remaining = math.floor(headroom / self.emission_interval + 1e-9)
+        if remaining > 0:
+            return remaining, 0.0
+        return 0, state.tat + self.emission_interval - self.time_window - now
+
+
+ALGORITHMS = {
+    "sliding_log": SlidingWindowLog,
+    "sliding_window": SlidingWindowCounter,
+    "token_bucket": TokenBucket,
+    "gcra": GCRA,
+}
+
+
+class _Stripe:
+    __slots__ = ("lock", "history", "evictions")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.history = OrderedDict()
+        self.evictions = 0
+
+
+class MemoryStorage:
+    # Storage backends decide where per-key state lives and make the
+    # read-check-write step atomic. The interface a backend implements
+    # (e.g. a Redis one running the algorithm in a Lua script):
+    #
+    #   check(key, now, algorithm, idle_ttl, blocking=True, detail=False)
+    #       -> bool, or (bool, remaining, retry_after) when detail is set, or
+    #       None when blocking is False and the key is locked by someone else
+    #   sweep(now, idle_ttl) -> number of keys evicted
+    #   stats() -> {"tracked_keys", "bytes_estimate", "evictions"}
+    #
+    # This one is process-local. Keys are hashed onto a fixed number of
+    # stripes, each with its own lock and least-recently-used table, so
+    # unrelated keys rarely contend and idle keys are evicted from the front
+    # of a table without scanning it.
+    SWEEP_BATCH = 2
+    STATS_SAMPLE = 1000
+
+    def __init__(self, stripes=16):
+        if stripes < 1 or stripes & (stripes - 1):
+            raise ValueError(f"stripes must be a power of two, got {stripes}")
+
+        self._stripes = [_Stripe() for _ in range(stripes)]
+        self._stripe_mask = stripes - 1
+
+    def check(self, key, now, algorithm, idle_ttl, blocking=True, detail=False):
+        stripe = self._stripes[hash(key) & self._stripe_mask]
+        if not stripe.lock.acquire(blocking):
+            return None
+        try:
+            history = stripe.history
+            state = history.get(key)
+            if state is None or now - state.last_seen > idle_ttl:
+                if state is not None:
+                    stripe.evictions += 1
+                state = history[key] = algorithm.new_state(now)
+            history.move_to_end(key)
+
+            allowed = algorithm.is_allowed(state, now)
+            state.last_seen = now
+            self._evict_idle(stripe, now, idle_ttl, self.SWEEP_BATCH)
+            if detail:
+                return (allowed,) + algorithm.limit_info(state, now)
+            return allowed
+        finally:
+            stripe.lock.release()
+
+    def _evict_idle(self, stripe, now, idle_ttl, limit=None):
+        history = stripe.history
+        evicted = 0
+        while history and (limit is None or evicted < limit):
+            key = next(iter(history))
+            if now - history[key].last_seen <= idle_ttl:
+                break
+            del history[key]
+            evicted += 1
+        stripe.evictions += evicted
+        return evicted
+
+    def sweep(self, now, idle_ttl):
+        evicted = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                evicted += self._evict_idle(stripe, now, idle_ttl)
+        return evicted
+
+    def stats(self):
+        tracked = evictions = table_bytes = 0
+        sample = []
+        per_stripe_sample = max(1, self.STATS_SAMPLE // len(self._stripes))
+        for stripe in self._stripes:
+            with stripe.lock:
+                tracked += len(stripe.history)
+                evictions += stripe.evictions
+                sample.extend(itertools.islice(stripe.history.items(), per_stripe_sample))
+                table_bytes += sys.getsizeof(stripe.history)
+        per_key = sum(sys.getsizeof(k) + s.nbytes() for k, s in sample) / len(sample) if sample else 0
+        return {
+            "tracked_keys": tracked,
+            "bytes_estimate": int(table_bytes + per_key * tracked),
+            "evictions": evictions,
+        }
+
+
+class _SharedTable:
+    __slots__ = ("fd", "mm", "locks", "capacity", "stripes", "users")
+
+
+# Tables open in this process, by (pid, real path). fcntl locks belong to the
+# process, so every SharedMemoryStorage on one file must also share the thread
+# locks, or two of them in one process would not exclude each other. The pid
+# keeps a forked child from inheriting its parent's (possibly held) locks.
+_shared_tables = {}
+_shared_tables_lock = threading.Lock()
+
+
+class SharedMemoryStorage:
+    # Per-key state in an mmap-backed, fixed-size hash table that every
+    # process opening the same path shares, so a limit holds across all
+    # uvicorn workers on a node. Only constant-size algorithms fit.
+    #
+    # The table is split into stripes. Each stripe is guarded by a thread lock
+    # (fcntl locks are per process, not per thread) plus an fcntl byte-range
+    # lock on the backing file for the other processes. Within a stripe,
+    # records are found by linear probing on a 64-bit key digest. Keys are
+    # never deleted in place (that would break probe chains); slots idle past
+    # idle_ttl are reused on insert, and sweep() rebuilds each stripe. When a
+    # stripe is full, the least recently seen key in it is evicted.
+    #
+    # There is no default path: services with different limits must not share
+    # a table, so each names its own (e.g. /dev/shm/rate-limits-dispute).
+    MAGIC = 0x524C494D
+    HEADER = struct.Struct("<QQQ")
+    RECORD = struct.Struct("<Qdddd")
+    COUNTER = struct.Struct("<Q")
+    MAX_FIELDS = 3
+
+    def __init__(self, path, capacity=65536, stripes=64):
+        if fcntl is None:
+            raise RuntimeError("SharedMemoryStorage requires a POSIX system (fcntl)")
+        if stripes < 1 or stripes & (stripes - 1):
+            raise ValueError(f"stripes must be a power of two, got {stripes}")
+        if capacity % stripes:
+            raise ValueError(f"capacity ({capacity}) must be a multiple of stripes ({stripes})")
+
+        self.path = path
+        self.capacity = capacity
+        self.stripes = stripes
+        self.slots_per_stripe = capacity // stripes
+        self._counters_offset = self.HEADER.size
+        self._records_offset = self._counters_offset + stripes * self.COUNTER.size
+
+        key = (os.getpid(), os.path.realpath(path))
+        with _shared_tables_lock:
+            table = _shared_tables.get(key)
+            if table is None:
+                table = _shared_tables[key] = self._open_table()
+            elif (table.capacity, table.stripes) != (capacity, stripes):
+                raise ValueError(f"{path} is already open with a different layout")
+            table.users += 1
+        self._key = key
+        self._table = table
+        self._fd = table.fd
+        self._mm = table.mm
+        self._locks = table.locks
+
+    def _open_table(self):
+        size = self._records_offset + self.capacity * self.RECORD.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        # The init lock lives past the end of the stripe locks.
+        fcntl.lockf(fd, fcntl.LOCK_EX, 1, self.stripes)
+        try:
+            existing = os.fstat(fd).st_size
+            if existing == 0:
+                os.ftruncate(fd, size)
+            elif existing != size:
+                raise ValueError(f"{self.path} holds a table of a different size ({existing} bytes, expected {size})")
+            mm = mmap.mmap(fd, size)
+            magic, stored_capacity, stored_stripes = self.HEADER.unpack_from(mm, 0)
+            if magic == 0:
+                self.HEADER.pack_into(mm, 0, self.MAGIC, self.capacity, self.stripes)
+            elif (magic, stored_capacity, stored_stripes) != (self.MAGIC, self.capacity, self.stripes):
+                mm.close()
+                raise ValueError(f"{self.path} holds a table with a different layout")
+        except BaseException:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, self.stripes)
+            os.close(fd)
+            raise
+        fcntl.lockf(fd, fcntl.LOCK_UN, 1, self.stripes)
+
+        table = _SharedTable()
+        table.fd, table.mm = fd, mm
+        table.locks = [threading.Lock() for _ in range(self.stripes)]
+        table.capacity, table.stripes, table.users = self.capacity, self.stripes, 0
+        return table
+
+    def close(self):
+        with _shared_tables_lock:
+            if self._table is None:
+                return
+            self._table.users -= 1
+            if self._table.users == 0:
+                del _shared_tables[self._key]
+                self._mm.close()
+                os.close(self._fd)
+            self._table = None
+
+    @staticmethod
+    def _digest(key):
+        digest = int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "little")
+        return digest or 1
+
+    def _acquire(self, stripe, blocking):
+        lock = self._locks[stripe]
+        if not lock.acquire(blocking):
+            return False
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB, 1, stripe)
+        except OSError:
+            lock.release()
+            if blocking:
+                raise
+            return False
+        return True
+
+    def _release(self, stripe):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+        self._locks[stripe].release()
+
+    def _record_offset(self, stripe, slot):
+        return self._records_offset + (stripe * self.slots_per_stripe + slot) * self.RECORD.size
+
+    def _count_evictions(self, stripe, count):
+        offset = self._counters_offset + stripe * self.COUNTER.size
+        self.COUNTER.pack_into(self._mm, offset, self.COUNTER.unpack_from(self._mm, offset)[0] + count)
+
+    def check(self, key, now, algorithm, idle_ttl, blocking=True, detail=False):
+        fields = algorithm.STATE_FIELDS
+        if fields is None or len(fields) > self.MAX_FIELDS:
+            raise ValueError(f"{type(algorithm).__name__} does not have a fixed-size state and cannot use shared storage")
+
+        digest = self._digest(key)
+        stripe = digest & (self.stripes - 1)
+        if not self._acquire(stripe, blocking):
+            return None
+        try:
+            mm = self._mm
+            record = self.RECORD
+            home = (digest >> 32) % self.slots_per_stripe
+            found = reusable = oldest = None
+            oldest_seen = math.inf
+            for i in range(self.slots_per_stripe):
+                slot = (home + i) % self.slots_per_stripe
+                values = record.unpack_from(mm, self._record_offset(stripe, slot))
+                if values[0] == digest:
+                    found = slot, values
+                    break
+                if values[0] == 0:
+                    if reusable is None:
+                        reusable = slot
+                    break
+                if reusable is None and now - values[1] > idle_ttl:
+                    reusable = slot
+                if values[1] < oldest_seen:
+                    oldest, oldest_seen = slot, values[1]
+
+            state = algorithm.new_state(now)
+            if found is not None:
+                slot, values = found
+                if now - values[1] <= idle_ttl:
+                    state.last_seen = values[1]
+                    for name, value in zip(fields, values[2:]):
+                        setattr(state, name, value)
+                else:
+                    self._count_evictions(stripe, 1)
+            else:
+                slot = reusable if reusable is not None else oldest
+                values = record.unpack_from(mm, self._record_offset(stripe, slot))
+                if values[0] != 0:
+                    self._count_evictions(stripe, 1)
+
+            allowed = algorithm.is_allowed(state, now)
+            packed = [getattr(state, name) for name in fields]
+            packed += [0.0] * (self.MAX_FIELDS - len(packed))
+            record.pack_into(mm, self._record_offset(stripe, slot), digest, now, *packed)
+            if detail:
+                state.last_seen = now
+                return (allowed,) + algorithm.limit_info(state, now)
+            return allowed
+        finally:
+            self._release(stripe)
+
+    def sweep(self, now, idle_ttl):
+        evicted = 0
+        empty = bytes(self.RECORD.size * self.slots_per_stripe)
+        for stripe in range(self.stripes):
+            self._acquire(stripe, True)
+            try:
+                start = self._record_offset(stripe, 0)
+                live = []
+                stripe_evicted = 0
+                for slot in range(self.slots_per_stripe):
+                    values = self.RECORD.unpack_from(self._mm, self._record_offset(stripe, slot))
+                    if values[0] == 0:
+                        continue
+                    if now - values[1] > idle_ttl:
+                        stripe_evicted += 1
+                    else:
+                        live.append(values)
+                if stripe_evicted == 0:
+                    continue
+                self._mm[start:start + len(empty)] = empty
+                for values in live:
+                    slot = (values[0] >> 32) % self.slots_per_stripe
+                    while self.RECORD.unpack_from(self._mm, self._record_offset(stripe, slot))[0] != 0:
+                        slot = (slot + 1) % self.slots_per_stripe
+                    self.RECORD.pack_into(self._mm, self._record_offset(stripe, slot), *values)
+                self._count_evictions(stripe, stripe_evicted)
+                evicted += stripe_evicted
+            finally:
+                self._release(stripe)
+        return evicted
+
+    def stats(self):
+        tracked = evictions = 0
+        for stripe in range(self.stripes):
+            self._acquire(stripe, True)
+            try:
+                evictions += self.COUNTER.unpack_from(self._mm, self._counters_offset + stripe * self.COUNTER.size)[0]
+                for slot in range(self.slots_per_stripe):
+                    tracked += self.RECORD.unpack_from(self._mm, self._record_offset(stripe, slot))[0] != 0
+            finally:
+                self._release(stripe)
+        return {
+            "tracked_keys": tracked,
+            "bytes_estimate": len(self._mm),
+            "evictions": evictions,
+        }
+
+
+class RateLimiter:
+    # An entry idle for longer than idle_ttl (default: two windows, after which
+    # every algorithm's state is indistinguishable from a fresh one) is dropped
+    # by the storage lazily and by sweep() / the background sweeper.
+    def __init__(self, max_requests, time_window, algorithm="sliding_log", idle_ttl=None, stripes=16, storage=None):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown rate limiting algorithm: {algorithm!r} (choose from {', '.join(ALGORITHMS)})")
+
+        self.max_requests = max_requests
+        self.time_window = time_window
+        self.idle_ttl = idle_ttl if idle_ttl is not None else 2 * time_window
+        self.algorithm = ALGORITHMS[algorithm](max_requests, time_window)
+        self.storage = storage if storage is not None else MemoryStorage(stripes)
+        if isinstance(self.storage, SharedMemoryStorage) and self.algorithm.STATE_FIELDS is None:
+            raise ValueError(f"Algorithm {algorithm!r} keeps variable-size state and cannot use shared storage")
+        self._sweeper = None
+        self._sweeper_stop = threading.Event()
+
+    def is_allowed(self, user_id, now=None):
+        if now is None:
+            now = time.time()
+
+        return self.storage.check(user_id, now, self.algorithm, self.idle_ttl)
+
+    def check(self, user_id, now=None):
+        # Like is_allowed, but also reports how many requests are left in the
+        # window and, when denied, how many seconds until the next one fits.
+        if now is None:
+            now = time.time()
+
+        return self.storage.check(user_id, now, self.algorithm, self.idle_ttl, detail=True)
+
+    def sweep(self, now=None):
+        return self.storage.sweep(time.time() if now is None else now, self.idle_ttl)
+
+    def start_sweeper(self, interval=None):
+        if self._sweeper is not None:
+            return
+        interval = interval if interval is not None else self.time_window
+        self._sweeper_stop.clear()
+
+        def run():
+            while not self._sweeper_stop.wait(interval):
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=run, name="rate-limiter-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        if self._sweeper is None:
+            return
+        self._sweeper_stop.set()
+        self._sweeper.join()
+        self._sweeper = None
+
+    def stats(self):
+        return self.storage.stats()
+
+
+class AsyncRateLimiter(RateLimiter):
+    # For event-loop servers: a contended key yields to the loop instead of
+    # blocking it while another thread or process holds the lock.
+    async def is_allowed(self, user_id, now=None):
+        if now is None:
+            now = time.time()
+
+        return await self._check(user_id, now, False)
+
+    async def check(self, user_id, now=None):
+        if now is None:
+            now = time.time()
+
+        return await self._check(user_id, now, True)
+
+    async def _check(self, user_id, now, detail):
+        while True:
+            result = self.storage.check(user_id, now, self.algorithm, self.idle_ttl, blocking=False, detail=detail)
+            if result is not None:
+                return result
+            await asyncio.sleep(0)
+
+
+def _compare_accuracy(algorithm, max_requests=100, time_window=60.0, duration=600.0, rate=3.0, seed=0):
+    import random
+
+    rng = random.Random(seed)
+    exact = RateLimiter(max_requests, time_window)
+    approx = RateLimiter(max_requests, time_window, algorithm)
+    now = 0.0
+    requests = agreed = exact_admitted = approx_admitted = 0
+    while now < duration:
+        now += rng.expovariate(rate)
+        a = exact.is_allowed("user", now)
+        b = approx.is_allowed("user", now)
+        requests += 1
+        agreed += a == b
+        exact_admitted += a
+        approx_admitted += b
+    return requests, agreed / requests, exact_admitted, approx_admitted
+
+
+def _benchmark(algorithm, max_requests, time_window, users=10000, calls=200000):
+    import tracemalloc
+
+    limiter = RateLimiter(max_requests, time_window, algorithm)
+    tracemalloc.start()
+    for i in range(users):
+        for _ in range(min(max_requests, 50)):
+            limiter.is_allowed(i)
+    bytes_per_user = tracemalloc.get_traced_memory()[0] / users
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for i in range(calls):
+        limiter.is_allowed(i % users)
+    elapsed = time.perf_counter() - start
+    return calls / elapsed, bytes_per_user
+
+
+def _churn(algorithm, rounds=20, active_users=5000, time_window=1.0):
+    # Each round a brand-new set of users arrives; tracked keys should plateau
+    # at the active working set instead of growing with every distinct key seen.
+    limiter = RateLimiter(10, time_window, algorithm)
+    now = 0.0
+    for r in range(rounds):
+        for i in range(active_users):
+            limiter.is_allowed((r, i), now)
+            now += time_window / active_users
+    return limiter.stats()
+
+
+def _stress(threads=8, max_requests=1000, calls_per_thread=5000):
+    # Every thread hammers the same key; exactly max_requests may get through.
+    limiter = RateLimiter(max_requests, 3600.0)
+    admitted = [0] * threads
+    barrier = threading.Barrier(threads)
+
+    def worker(n):
+        barrier.wait()
+        for _ in range(calls_per_thread):
+            admitted[n] += limiter.is_allowed("hot-key")
+
+    previous_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    finally:
+        sys.setswitchinterval(previous_interval)
+    return sum(admitted)
+
+
+def _thread_scaling(threads, stripes, calls_per_thread=50000, keys=10000):
+    limiter = RateLimiter(100, 60.0, "gcra", stripes=stripes)
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(n):
+        barrier.wait()
+        for i in range(calls_per_thread):
+            limiter.is_allowed((n * calls_per_thread + i) % keys)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    return threads * calls_per_thread / (time.perf_counter() - start)
+
+
+def _async_stress(tasks=100, max_requests=1000, calls_per_task=100):
+    limiter = AsyncRateLimiter(max_requests, 3600.0)
+
+    async def worker():
+        admitted = 0
+        for _ in range(calls_per_task):
+            admitted += await limiter.is_allowed("hot-key")
+            await asyncio.sleep(0)
+        return admitted
+
+    async def main():
+        return sum(await asyncio.gather(*(worker() for _ in range(tasks))))
+
+    return asyncio.run(main())
+
+
+def _shared_worker(path, max_requests, time_window, calls, barrier, results):
+    limiter = RateLimiter(max_requests, time_window, "gcra", storage=SharedMemoryStorage(path))
+    barrier.wait()
+    admitted = 0
+    for _ in range(calls):
+        admitted += limiter.is_allowed("hot-key")
+    results.put(admitted)
+
+
+def _process_stress(processes=4, max_requests=1000, calls_per_process=5000):
+    import multiprocessing
+
+    path = os.path.join(tempfile.mkdtemp(), "rate-limits")
+    time_window = 365 * 86400.0
+    barrier = multiprocessing.Barrier(processes)
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_shared_worker, args=(path, max_requests, time_window, calls_per_process, barrier, results))
+        for _ in range(processes)
+    ]
+    for w in workers:
+        w.start()
+    admitted = sum(results.get() for _ in workers)
+    for w in workers:
+        w.join()
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+    return admitted
+
+
+def _storage_latency(storage, calls=100000, keys=10000):
+    limiter = RateLimiter(100, 60.0, "gcra", storage=storage)
+    start = time.perf_counter()
+    for i in range(calls):
+        limiter.is_allowed(i % keys)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RateLimiter accuracy, memory and concurrency benchmarks")
+    suites = ["accuracy", "memory", "threads", "processes"]
+    # Checked by hand: argparse rejects an empty list against choices with nargs="*".
+    parser.add_argument("suites", nargs="*", help=f"Suites to run: {', '.join(suites)} (default: all)")
+    args = parser.parse_args()
+    unknown = [suite for suite in args.suites if suite not in suites]
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(unknown)}")
+    args.suites = args.suites or suites
+    failures = []
+
+    def check_admitted(label, admitted, limit=1000):
+        print(f"{label} {admitted} admitted for a limit of {limit} ({'OK' if admitted == limit else 'OVER-ADMITTED'})")
+        if admitted != limit:
+            failures.append(label)
+
+    if "accuracy" in args.suites:
+        print(f"{'algorithm':<16}{'agreement':>11}{'exact':>8}{'approx':>8}{'ops/sec':>12}{'bytes/user':>12}")
+        for name in ALGORITHMS:
+            requests, agreement, exact_admitted, approx_admitted = _compare_accuracy(name)
+            ops, bytes_per_user = _benchmark(name, max_requests=10000, time_window=60.0)
+            print(f"{name:<16}{agreement:>10.1%}{exact_admitted:>8}{approx_admitted:>8}{ops:>12,.0f}{bytes_per_user:>12,.0f}")
+
+    if "memory" in args.suites:
+        for name in ALGORITHMS:
+            stats = _churn(name)
+            print(f"{name:<16}after 100000 distinct keys: {stats}")
+
+    if "threads" in args.suites:
+        check_admitted("threaded stress:", _stress())
+        check_admitted("asyncio stress: ", _async_stress())
+        for stripes in (1, 16):
+            for threads in (1, 2, 4, 8):
+                print(f"stripes={stripes:<3} threads={threads}: {_thread_scaling(threads, stripes):>12,.0f} ops/sec")
+
+    if "processes" in args.suites:
+        check_admitted("4-process shared stress:", _process_stress())
+        shared_path = os.path.join(tempfile.mkdtemp(), "rate-limits")
+        shared = SharedMemoryStorage(shared_path)
+        print(f"memory storage: {_storage_latency(MemoryStorage()):.2f} us/check")
+        print(f"shared storage: {_storage_latency(shared):.2f} us/check")
+        shared.close()
+        os.remove(shared_path)
+        os.rmdir(os.path.dirname(shared_path))
+
+    if failures:
+        sys.exit(f"Failed: {', '.join(failures)}")
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("flask")
+os.environ.setdefault("MODEL_LOADING", "lazy")  # the priority rules don't need the model
+
+import customerDisputeAPI as api
+
+CATEGORIES = list(api.DISPUTE_CATEGORIES)
+EDGE_AMOUNTS = [0, api.MEDIUM_THRESHOLD / 2, api.MEDIUM_THRESHOLD, api.HIGH_THRESHOLD]
+
+
+@pytest.fixture(autouse=True)
+def quiet_logger(monkeypatch):
+    monkeypatch.setattr(api.logger, "disabled", True)
+
+
+def per_dispute_priorities(categories, amounts, histories):
+    # The rules /dispute applies, one dispute at a time.
+    priorities = []
+    for category, amount, history in zip(categories, amounts, histories):
+        priority = api.base_priority(category, amount)
+        if history:
+            priority = api.adjust_priority_by_history(category, priority, history)
+        priorities.append(priority)
+    return priorities
+
+
+def column_wise_priorities(categories, amounts, histories):
+    return [api.PRIORITIES[p] for p in api.assign_priorities(categories, amounts, histories)]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_column_wise_priorities_match_per_dispute_rules(seed):
+    n = 20000
+    rng = np.random.default_rng(seed)
+    categories = rng.choice(CATEGORIES, n).tolist()
+    amounts = (rng.choice([0, 400, 600, 1200, 6000], n) + rng.random(n)).tolist()
+    tiers = rng.choice(["standard", "Premium", "VIP"], n)
+    histories = []
+    for i in range(n):
+        if rng.random() < 0.2:
+            histories.append({})
+            continue
+        histories.append({
+            "tier": str(tiers[i]),
+            "previous_disputes": int(rng.integers(0, 6)),
+            "valid_disputes_pct": int(rng.integers(50, 100)),
+            "account_age_days": int(rng.integers(0, 60)),
+            "recent_disputes_30d": int(rng.integers(0, 5)),
+            "lifetime_value": int(rng.choice([1000, 60000])),
+        })
+
+    assert column_wise_priorities(categories, amounts, histories) == per_dispute_priorities(categories, amounts, histories)
+
+
+@pytest.mark.parametrize("history", [
+    {},
+    {"tier": "premium"},
+    {"valid_disputes_pct": 80, "previous_disputes": 3},
+    {"valid_disputes_pct": 81, "previous_disputes": 2},
+    {"valid_disputes_pct": 81, "previous_disputes": 3},
+    {"recent_disputes_30d": 3},
+    {"account_age_days": 30},
+    {"account_age_days": 29},
+    {"lifetime_value": 50000},
+    {"lifetime_value": 50001},
+])
+def test_column_wise_priorities_match_at_thresholds(history):
+    categories = [category for category in CATEGORIES for _ in EDGE_AMOUNTS]
+    amounts = EDGE_AMOUNTS * len(CATEGORIES)
+    histories = [history] * len(categories)
+
+    assert column_wise_priorities(categories, amounts, histories) == per_dispute_priorities(categories, amounts, histories)
@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+from benchmarkSuite import check_shared_memory
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="reads RSS from /proc")
+def test_shared_service_keeps_one_model_copy():
+    workers, weights_mb = 3, 64
+    usage = check_shared_memory(workers, weights_mb)
+    in_process, shared = usage["in-process"], usage["shared"]
+
+    # Workers using the service hold no model copy; the service holds one.
+    assert max(shared["workers"]) < min(in_process["workers"]) - 0.75 * weights_mb
+    assert shared["service"] > weights_mb
+    assert shared["total"] < in_process["total"]
@@ -0,0 +1,67 @@
+import io
+import itertools
+
+import numpy as np
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("asyncpg")
+
+import fullStackCustomerPortal as portal
+
+
+def per_request_results(income, credit_score, loan_amount):
+    return [
+        portal.eligibility_result(portal.eligibility_tier(inc, cs, amt))
+        for inc, cs, amt in zip(income, credit_score, loan_amount)
+    ]
+
+
+def vectorized_results(income, credit_score, loan_amount, chunk_size=portal.BATCH_CHUNK_SIZE):
+    results = []
+    for scores, tiers in portal.iter_eligibility_results(np.asarray(income), np.asarray(credit_score),
+                                                         np.asarray(loan_amount), chunk_size):
+        results.extend({"score": int(score), "recommendation": portal.ELIGIBILITY_RECOMMENDATIONS[tier]}
+                       for score, tier in zip(scores.tolist(), tiers.tolist()))
+    return results
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_vectorized_scores_match_per_request_on_random_rows(seed):
+    n = 50000
+    rng = np.random.default_rng(seed)
+    income = rng.uniform(0, 150000, n).round(2).tolist()
+    credit_score = rng.integers(300, 851, n).tolist()
+    loan_amount = rng.uniform(0, 1000000, n).round(2).tolist()
+
+    assert vectorized_results(income, credit_score, loan_amount, chunk_size=7919) == \
+        per_request_results(income, credit_score, loan_amount)
+
+
+def test_vectorized_scores_match_per_request_at_thresholds():
+    rows = []
+    for inc, cs in itertools.product([29999.99, 30000, 30000.01, 49999.99, 50000, 50000.01, 80000],
+                                     [599, 600, 601, 749, 750, 751]):
+        for amount in [inc * 5, inc * 7, inc * 5 - 0.01, inc * 7 - 0.01, inc * 5 + 0.01, inc * 7 + 0.01, 0]:
+            rows.append((inc, cs, amount))
+    income, credit_score, loan_amount = zip(*rows)
+
+    assert vectorized_results(income, credit_score, loan_amount) == per_request_results(income, credit_score, loan_amount)
+
+
+def test_score_file_accepts_whole_number_floats(tmp_path):
+    path = tmp_path / "applicants.csv"
+    path.write_text("income,credit_score,loan_amount\n60000,760.0,100000\n40000,650,200000\n")
+    out = io.StringIO()
+
+    assert portal.score_file(str(path), out) == 2
+    scores = [line.split(",")[3] for line in out.getvalue().splitlines()[1:]]
+    assert scores == ["90", "70"]
+
+
+def test_score_file_reports_the_bad_line(tmp_path):
+    path = tmp_path / "applicants.csv"
+    path.write_text("income,credit_score,loan_amount\n60000,760,100000\n40000,650.5,200000\n")
+
+    with pytest.raises(ValueError, match="line 3: credit_score must be a whole number"):
+        portal.score_file(str(path), io.StringIO())
@@ -0,0 +1,128 @@
+import random
+
+import pytest
+
+from rateLimitor import ALGORITHMS, RateLimiter, _compare_accuracy
+
+MAX_REQUESTS = 100
+TIME_WINDOW = 60.0
+DURATION = 600.0
+APPROXIMATE = [name for name in ALGORITHMS if name != "sliding_log"]
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_burst_admits_exactly_the_limit(algorithm):
+    limiter = RateLimiter(MAX_REQUESTS, TIME_WINDOW, algorithm)
+    admitted = sum(limiter.is_allowed("user", 0.0) for _ in range(3 * MAX_REQUESTS))
+    assert admitted == MAX_REQUESTS
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+@pytest.mark.parametrize("seed", range(3))
+def test_traffic_under_the_limit_is_never_rejected(algorithm, seed):
+    _, agreement, exact, approx = _compare_accuracy(algorithm, MAX_REQUESTS, TIME_WINDOW, DURATION, rate=0.5, seed=seed)
+    assert agreement == 1.0
+    assert approx == exact
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("rate", [1.5, 3.0, 10.0])
+def test_sliding_log_matches_brute_force_count(rate, seed):
+    # The other accuracy tests use sliding_log as the exact reference, so check
+    # it against a plain count of admitted timestamps still in the window.
+    rng = random.Random(seed)
+    limiter = RateLimiter(MAX_REQUESTS, TIME_WINDOW, "sliding_log")
+    admitted = []
+    now = 0.0
+    while now < DURATION:
+        now += rng.expovariate(rate)
+        expected = sum(now - t <= TIME_WINDOW for t in admitted) < MAX_REQUESTS
+        assert limiter.is_allowed("user", now) == expected
+        if expected:
+            admitted.append(now)
+
+
+@pytest.mark.parametrize("algorithm", APPROXIMATE)
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("rate", [1.5, 3.0, 10.0])
+def test_approximate_admitted_counts_stay_close_to_exact(algorithm, rate, seed):
+    _, _, exact, approx = _compare_accuracy(algorithm, MAX_REQUESTS, TIME_WINDOW, DURATION, rate, seed)
+    if algorithm == "sliding_window":
+        # Weighted previous-window estimate: within a few percent either way.
+        assert abs(approx - exact) <= 0.03 * exact
+    else:
+        # Token bucket / GCRA: one initial burst plus the steady refill rate,
+        # never fewer than the exact log, never more than that bound.
+        assert exact <= approx <= MAX_REQUESTS + DURATION * MAX_REQUESTS / TIME_WINDOW
+
+
+def test_memory_stats_count_every_stripe_table():
+    import sys
+
+    from rateLimitor import MemoryStorage
+
+    storage = MemoryStorage(stripes=4)
+    storage.STATS_SAMPLE = 10 ** 6  # sample every key, so the estimate is exact
+    limiter = RateLimiter(MAX_REQUESTS, TIME_WINDOW, storage=storage)
+    # Small ints hash to themselves: 5000 keys in stripe 0, one in each other stripe.
+    for key in [4 * i for i in range(5000)] + [1, 2, 3]:
+        limiter.is_allowed(key, 0.0)
+
+    expected = 0
+    for stripe in storage._stripes:
+        expected += sys.getsizeof(stripe.history)
+        expected += sum(sys.getsizeof(key) + state.nbytes() for key, state in stripe.history.items())
+    stats = storage.stats()
+    assert stats["tracked_keys"] == 5003
+    assert abs(stats["bytes_estimate"] - expected) <= 1
+
+
+def test_threads_never_over_admit():
+    from rateLimitor import _stress
+
+    assert _stress(threads=8, max_requests=1000, calls_per_thread=2000) == 1000
+
+
+def test_asyncio_tasks_never_over_admit():
+    from rateLimitor import _async_stress
+
+    assert _async_stress(tasks=100, max_requests=1000, calls_per_task=50) == 1000
+
+
+def test_processes_sharing_storage_never_over_admit():
+    import rateLimitor
+
+    if rateLimitor.fcntl is None:
+        pytest.skip("SharedMemoryStorage needs fcntl")
+    assert rateLimitor._process_stress(processes=4, max_requests=1000, calls_per_process=2000) == 1000
+
+
+def test_shared_storages_on_one_path_exclude_each_other(tmp_path):
+    import threading
+
+    import rateLimitor
+
+    if rateLimitor.fcntl is None:
+        pytest.skip("SharedMemoryStorage needs fcntl")
+    path = str(tmp_path / "rate-limits")
+    storages = [rateLimitor.SharedMemoryStorage(path), rateLimitor.SharedMemoryStorage(str(tmp_path / "." / "rate-limits"))]
+    # fcntl locks never block within one process, so the thread locks must be shared.
+    assert storages[0]._locks is storages[1]._locks
+    limiters = [RateLimiter(1000, TIME_WINDOW, "gcra", storage=storage) for storage in storages]
+    admitted = []
+
+    def worker(limiter):
+        admitted.append(sum(limiter.is_allowed("hot-key", 0.0) for _ in range(2000)))
+
+    threads = [threading.Thread(target=worker, args=(limiters[i % 2],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(admitted) == 1000
+
+    with pytest.raises(ValueError):
+        rateLimitor.SharedMemoryStorage(path, capacity=1024)
+    for storage in storages:
+        storage.close()
+    assert not rateLimitor._shared_tables